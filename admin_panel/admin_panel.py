@@ -1,17 +1,36 @@
 import os
+import io
 import pandas as pd
 import streamlit as st
 
 from db import (
-    get_pending_withdrawals, update_withdrawal_status,
-    adjust_user_balance, find_user, log_action,
-    get_audit_logs, list_users, set_user_role, list_withdrawals, ensure_user
+    get_pending_withdrawals, decide_withdrawal, decide_withdrawals,
+    adjust_user_balance, find_user,
+    get_audit_logs, list_users, set_user_role, list_withdrawals, ensure_user,
+    pool_stats, replica_stats, user_cache_stats, audit_stats, next_cursor,
+    apply_balance_csv, BulkBalanceError,
 )
 
 st.set_page_config(page_title="TrustMe AI — Admin", page_icon="🛡️", layout="wide")
 st.title("🛡️ TrustMe AI — Admin Panel (v3.7.6)")
 
 ADMIN_PASSPHRASE = os.getenv("ADMIN_PASSPHRASE")
+PAGE_SIZE = 50
+
+def paged_table(key, fetch, ts_col):
+    """Show one keyset page from fetch(limit, after) with Newer/Older buttons."""
+    cursors = st.session_state.setdefault(f"{key}_cursors", [None])
+    rows = fetch(PAGE_SIZE, cursors[-1])
+    st.dataframe(pd.DataFrame(rows), use_container_width=True)
+    col1, col2 = st.columns(2)
+    if len(cursors) > 1 and col1.button("◀ Newer", key=f"{key}_newer"):
+        cursors.pop()
+        st.rerun()
+    nxt = next_cursor(rows, ts_col, PAGE_SIZE)
+    if nxt and col2.button("Older ▶", key=f"{key}_older"):
+        cursors.append(nxt)
+        st.rerun()
+    return rows
 
 if "authed" not in st.session_state:
     st.session_state.authed = False
@@ -30,6 +49,8 @@ if not st.session_state.authed:
     st.stop()
 else:
     st.caption(f"Signed in as **{st.session_state.admin_display}**")
+    with st.sidebar.expander("DB stats"):
+        st.json({"pool": pool_stats(), "replica": replica_stats(), "user_cache": user_cache_stats(), "audit": audit_stats()})
 
 tab1, tab2, tab3, tab4, tab5 = st.tabs(["💸 Withdrawals", "💼 Balances", "👥 Users", "🧾 Logs", "🔧 All Withdrawals"])
 
@@ -41,6 +62,17 @@ with tab1:
     else:
         df = pd.DataFrame(pending)
         st.dataframe(df, use_container_width=True)
+        st.markdown("**Batch decision** — decides all selected requests in one transaction; denied ones are refunded.")
+        chosen = st.multiselect("Requests", [r['id'] for r in pending], key="batch_ids",
+                                format_func=lambda i: next(f"#{r['id']} — {r['amount']} by @{r.get('username') or r.get('tg_user_id')}" for r in pending if r['id'] == i))
+        batch_note = st.text_input("Note for the batch", key="batch_note")
+        colA, colB = st.columns(2)
+        for col, label, status in ((colA, "✅ Approve selected", "approved"), (colB, "⛔ Deny selected", "denied")):
+            if col.button(label, key=f"batch_{status}", disabled=not chosen):
+                note = batch_note or ("Denied" if status == "denied" else None)
+                decided, skipped = decide_withdrawals(chosen, status, st.session_state.admin_display, note)
+                st.success(f"{status.capitalize()} {len(decided)} withdrawals" + (f"; skipped {len(skipped)} no longer pending" if skipped else ""))
+                st.rerun()
         for row in pending:
             with st.expander(f"Request #{row['id']} — {row['amount']} by @{row.get('username') or row.get('tg_user_id')}"):
                 col1, col2, col3 = st.columns(3)
@@ -48,19 +80,18 @@ with tab1:
                 note = col2.text_input(f"Note for #{row['id']}", key=f"note_{row['id']}")
                 colA, colB = st.columns(2)
                 if colA.button("✅ Approve", key=f"approve_{row['id']}"):
-                    updated = update_withdrawal_status(row['id'], "approved", st.session_state.admin_display, txid, note)
-                    log_action(st.session_state.admin_display, "withdrawal_approve", "withdrawal", str(row['id']), {"before": row, "after": updated})
-                    st.success(f"Approved withdrawal #{row['id']}")
+                    prev, updated = decide_withdrawal(row['id'], "approved", st.session_state.admin_display, txid or None, note or None) or (None, None)
+                    if updated is None:
+                        st.error(f"Withdrawal #{row['id']} is no longer pending")
+                    else:
+                        st.success(f"Approved withdrawal #{row['id']}")
                     st.rerun()
                 if colB.button("⛔ Deny", key=f"deny_{row['id']}"):
-                    updated = update_withdrawal_status(row['id'], "denied", st.session_state.admin_display, None, note or "Denied")
-                    try:
-                        if row.get('status') == 'pending':
-                            adjust_user_balance(row['user_id'], 'add', float(row['amount']))
-                    except Exception as e:
-                        st.warning(f"Auto-refund failed: {e}")
-                    log_action(st.session_state.admin_display, "withdrawal_deny", "withdrawal", str(row['id']), {"before": row, "after": updated})
-                    st.warning(f"Denied withdrawal #{row['id']} — refunded user balance")
+                    prev, updated = decide_withdrawal(row['id'], "denied", st.session_state.admin_display, None, note or "Denied") or (None, None)
+                    if updated is None:
+                        st.error(f"Withdrawal #{row['id']} is no longer pending")
+                    else:
+                        st.warning(f"Denied withdrawal #{row['id']} — refunded user balance")
                     st.rerun()
 
 with tab2:
@@ -76,16 +107,26 @@ with tab2:
             if mode == "get":
                 st.info(f"Current balance for @{user.get('username') or user.get('tg_user_id')}: **{user['balance']}**")
             else:
-                before = user.copy()
-                updated = adjust_user_balance(user['id'], mode, amount)
-                log_action(st.session_state.admin_display, f"balance_{mode}", "user", str(user['id']), {"before": before, "after": updated, "amount": amount})
+                updated = adjust_user_balance(user['id'], mode, amount, actor=st.session_state.admin_display)
                 st.success(f"Balance updated: now **{updated['balance']}**")
 
+    st.markdown("**Bulk adjust from CSV** — header `tg_id` or `user_id`, `mode`, `amount`; all rows apply in one transaction or none do.")
+    upload = st.file_uploader("Balance CSV", type=["csv"])
+    dry_run = st.checkbox("Dry run (validate only)", value=True)
+    if upload is not None and st.button("Apply CSV"):
+        try:
+            result = apply_balance_csv(io.StringIO(upload.getvalue().decode("utf-8-sig"), newline=""),
+                                       st.session_state.admin_display, dry_run=dry_run)
+        except BulkBalanceError as e:
+            st.error(str(e))
+            if e.errors:
+                st.dataframe(pd.DataFrame(e.errors, columns=["line", "problem"]), use_container_width=True)
+        else:
+            st.success(f"{'Validated' if dry_run else 'Applied'} {result['rows']} rows, net change {result['total_delta']}")
+
 with tab3:
     st.subheader("Users & Roles")
-    users = list_users(limit=500)
-    dfu = pd.DataFrame(users)
-    st.dataframe(dfu, use_container_width=True)
+    paged_table("users", lambda limit, after: list_users(limit=limit, after=after), "created_at")
     target = st.text_input("Change role for (Telegram id or @username)")
     new_role = st.selectbox("New role", ["admin","manager","support","user"])
     if st.button("Update Role"):
@@ -93,20 +134,14 @@ with tab3:
         if not user:
             st.error("User not found")
         else:
-            before = user.copy()
-            updated = set_user_role(user['id'], new_role)
-            log_action(st.session_state.admin_display, "role_set", "user", str(user['id']), {"before": before, "after": updated})
+            updated = set_user_role(user['id'], new_role, actor=st.session_state.admin_display)
             st.success(f"Role updated for @{updated.get('username') or updated.get('tg_user_id')} → **{updated['role']}**")
 
 with tab4:
-    st.subheader("Audit Logs (latest 200)")
-    logs = get_audit_logs(200)
-    dfl = pd.DataFrame(logs)
-    st.dataframe(dfl, use_container_width=True)
+    st.subheader("Audit Logs")
+    paged_table("logs", lambda limit, after: get_audit_logs(limit, after=after), "created_at")
 
 with tab5:
     st.subheader("All Withdrawals")
     status = st.selectbox("Filter status", ["", "pending","approved","denied"])
-    rows = list_withdrawals(status or None, limit=500)
-    dfw = pd.DataFrame(rows)
-    st.dataframe(dfw, use_container_width=True)
+    paged_table(f"withdrawals_{status}", lambda limit, after: list_withdrawals(status or None, limit=limit, after=after), "requested_at")
@@ -6,6 +6,7 @@ import pandas as pd
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from redhawk_engine import run_redhawk_trade, init_log
+from bot.tail import tail_rows
 
 LOG_FILE = "logs/redhawk_trade_log.csv"
 
@@ -28,5 +29,10 @@ if st.button("🚀 Run RedHawk Simulation"):
 # Show recent log
 if os.path.exists(LOG_FILE):
     st.subheader("📄 Recent Trade Log")
-    df = pd.read_csv(LOG_FILE, on_bad_lines="skip")
-    st.dataframe(df.tail(10))
\ No newline at end of file
+    columns, rows, _ = tail_rows(LOG_FILE, 10)
+    df = pd.DataFrame(rows, columns=columns)
+    for col in df.columns:
+        as_num = pd.to_numeric(df[col], errors="coerce")
+        if as_num.notna().all():
+            df[col] = as_num
+    st.dataframe(df)
\ No newline at end of file
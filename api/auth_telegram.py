@@ -1,135 +1,87 @@
 
-import os, hmac, hashlib, time, jwt
-from typing import Dict, Any, Optional, List
+import os, io, csv, zlib, hmac, hashlib, time, jwt, logging, asyncio, json, threading, weakref
+import anyio
+from datetime import date, datetime
+from decimal import Decimal
+from contextlib import asynccontextmanager
+from typing import Dict, Any, List
 
-import psycopg2, psycopg2.extras
 from fastapi import FastAPI, HTTPException, Request, Depends
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse, FileResponse, JSONResponse
+from fastapi.responses import HTMLResponse, FileResponse, JSONResponse, Response, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+
+from bot.migrate import latest_version
+from bot.pool import get_pool, pool_stats, replica_stats, close_pool, DB_POOL_MAX
+from bot.db import user_cache_stats, audit_stats, next_cursor, read_connection, DASHBOARD_FIELDS
+from bot.audit import audit_writer
+from bot.cache import user_cache_sync
+from bot.bulk_balance import apply_balance_csv, BulkBalanceError
+from bot.events import admin_events
+from bot import db_async as adb
 
 BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 JWT_SECRET = os.getenv("JWT_SECRET", "change-me")
 ALLOWED_ORIGIN = os.getenv("ALLOWED_ORIGIN")
 DATABASE_URL = os.getenv("DATABASE_URL")
 ADMIN_IDS = {int(x) for x in os.getenv("ADMIN_IDS","").replace(";",",").replace(" ",",").split(",") if x.strip().isdigit()}
-
-def get_conn():
-    if not DATABASE_URL:
-        raise RuntimeError("DATABASE_URL not set")
-    return psycopg2.connect(DATABASE_URL, cursor_factory=psycopg2.extras.RealDictCursor)
-
-def _has_column(cur, table: str, column: str) -> bool:
-    cur.execute("SELECT 1 FROM information_schema.columns WHERE table_name=%s AND column_name=%s", (table, column))
-    return cur.fetchone() is not None
-
-def migrate_schema():
-    sql = """
-DO $$
-BEGIN
-  IF NOT EXISTS (SELECT 1 FROM information_schema.tables WHERE table_name='users') THEN
-    CREATE TABLE users (
-      id BIGSERIAL PRIMARY KEY,
-      tg_user_id BIGINT UNIQUE,
-      username TEXT,
-      full_name TEXT,
-      role TEXT NOT NULL DEFAULT 'user' CHECK (role IN ('admin','manager','support','user')),
-      balance NUMERIC(18,6) NOT NULL DEFAULT 0,
-      created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
-    );
-  END IF;
-
-  IF NOT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name='users' AND column_name='tg_user_id') THEN
-    ALTER TABLE users ADD COLUMN tg_user_id BIGINT;
-  END IF;
-  IF NOT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name='users' AND column_name='username') THEN
-    ALTER TABLE users ADD COLUMN username TEXT;
-  END IF;
-  IF NOT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name='users' AND column_name='full_name') THEN
-    ALTER TABLE users ADD COLUMN full_name TEXT;
-  END IF;
-  IF NOT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name='users' AND column_name='role') THEN
-    ALTER TABLE users ADD COLUMN role TEXT NOT NULL DEFAULT 'user';
-  END IF;
-  IF NOT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name='users' AND column_name='balance') THEN
-    ALTER TABLE users ADD COLUMN balance NUMERIC(18,6) NOT NULL DEFAULT 0;
-  END IF;
-  IF NOT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name='users' AND column_name='created_at') THEN
-    ALTER TABLE users ADD COLUMN created_at TIMESTAMPTZ NOT NULL DEFAULT NOW();
-  END IF;
-  IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname='users_tg_user_id_key') THEN
-    ALTER TABLE users ADD CONSTRAINT users_tg_user_id_key UNIQUE (tg_user_id);
-  END IF;
-END $$;
-
-CREATE TABLE IF NOT EXISTS withdrawals (
-  id BIGSERIAL PRIMARY KEY,
-  user_id BIGINT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
-  amount NUMERIC(18,6) NOT NULL CHECK (amount > 0),
-  address TEXT NOT NULL,
-  network TEXT NOT NULL DEFAULT 'TRC20',
-  status TEXT NOT NULL DEFAULT 'pending' CHECK (status IN ('pending','approved','denied')),
-  requested_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
-  decided_at TIMESTAMPTZ,
-  decided_by TEXT,
-  txid TEXT,
-  note TEXT
-);
-CREATE INDEX IF NOT EXISTS withdrawals_status_idx ON withdrawals(status);
-
-CREATE TABLE IF NOT EXISTS audit_logs (
-  id BIGSERIAL PRIMARY KEY,
-  actor TEXT,
-  action TEXT NOT NULL,
-  entity_type TEXT,
-  entity_id TEXT,
-  meta JSONB,
-  created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
-);
-
--- Backfill legacy tg_id if exists
-DO $$ BEGIN
-IF EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name='users' AND column_name='tg_id')
-THEN UPDATE users SET tg_id = COALESCE(tg_id, tg_user_id); END IF;
-END $$;
-"""
-    with get_conn() as conn:
-        with conn.cursor() as cur:
-            cur.execute(sql)
-        conn.commit()
-
-def ensure_user(tg_user_id: int, username: Optional[str]=None, full_name: Optional[str]=None):
-    migrate_schema()
-    with get_conn() as conn:
-        with conn.cursor() as cur:
-            # fetch by tg_user_id, fallback tg_id
-            cur.execute("SELECT * FROM users WHERE tg_user_id=%s", (tg_user_id,))
-            row = cur.fetchone()
-            if not row:
-                cur.execute("SELECT * FROM users WHERE tg_id=%s", (tg_user_id,))
-                row = cur.fetchone()
-            if row:
-                return row
-            cols = ["tg_user_id","username","full_name"]
-            vals = [tg_user_id, username, full_name]
-            if _has_column(cur, "users", "tg_id"):
-                cols = ["tg_user_id","tg_id","username","full_name"]
-                vals = [tg_user_id, tg_user_id, username, full_name]
-            cur.execute(f"INSERT INTO users ({','.join(cols)}) VALUES ({','.join(['%s']*len(vals))}) RETURNING *", tuple(vals))
-            conn.commit()
-            return cur.fetchone()
-
-def is_admin(tg_id: int) -> bool:
+AUTO_MIGRATE = os.getenv("AUTO_MIGRATE", "1") == "1"
+COMPRESS_MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", "1024"))  # bytes; smaller responses go out uncompressed
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+log = logging.getLogger("trustmeai.api")
+
+def _json_default(v):
+    # Decimal -> number by jsonable_encoder's rule: int without a fractional part
+    # (Decimal("5")), float otherwise (Decimal("5.000000") -> 5.0). Datetimes only
+    # reach here without orjson.
+    if isinstance(v, Decimal):
+        return int(v) if v.as_tuple().exponent >= 0 else float(v)
+    if isinstance(v, (datetime, date)):
+        return v.isoformat()
+    raise TypeError(f"Object of type {type(v).__name__} is not JSON serializable")
+
+def dumps(payload) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(payload, default=_json_default)
+    return json.dumps(payload, default=_json_default, separators=(",", ":")).encode("utf-8")
+
+class FastJSONResponse(JSONResponse):
+    """Serialises DB rows (RealDictRow, Decimal, datetime) directly, with orjson when installed.
+
+    Routes return it themselves so FastAPI's per-value jsonable_encoder pass is skipped.
+    """
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+# Read endpoints carry weak ETags built from cheap change markers (table version
+# counters, a per-user change counter) plus the request parameters, so a poll that finds
+# nothing new gets a 304 without running the listing query or sending the body.
+CACHE_CONTROL = "private, no-cache"
+
+def _etag(*parts) -> str:
+    return 'W/"' + hashlib.sha1(repr(parts).encode()).hexdigest()[:24] + '"'
+
+def _not_modified(req: Request, tag: str):
+    match = req.headers.get("If-None-Match")
+    if match and (match.strip() == "*" or tag in (t.strip() for t in match.split(","))):
+        return Response(status_code=304, headers={"ETag": tag, "Cache-Control": CACHE_CONTROL})
+    return None
+
+def _tagged(payload, tag: str) -> FastJSONResponse:
+    return FastJSONResponse(payload, headers={"ETag": tag, "Cache-Control": CACHE_CONTROL})
+
+async def is_admin(tg_id: int) -> bool:
     if tg_id in ADMIN_IDS:
         return True
-    with get_conn() as conn:
-        with conn.cursor() as cur:
-            cur.execute("SELECT role FROM users WHERE tg_user_id=%s", (tg_id,))
-            r = cur.fetchone()
-            if not r:
-                cur.execute("SELECT role FROM users WHERE tg_id=%s", (tg_id,))
-                r = cur.fetchone()
-            return bool(r and r.get("role") in ("admin","manager"))
+    # Straight from the primary: a demotion must take effect on the next request.
+    return await adb.get_user_role(tg_id) in ("admin","manager")
 
 def _check_telegram_auth(auth_data: Dict[str, Any]) -> Dict[str, Any]:
     if not BOT_TOKEN:
@@ -175,7 +127,33 @@ def auth_from_header(req: Request) -> Dict[str, Any]:
     except Exception as e:
         raise HTTPException(401, f"Invalid token: {e}")
 
-app = FastAPI(title="TrustMe AI — Web API")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Every route reaches the database through the shared connection pool on
+    # db_async's bounded executor, so a slow query only occupies one worker thread.
+    adb.start()
+    # Both are in requirements.txt; a missing one falls back quietly, so say which path runs.
+    log.info(f"JSON via {'orjson' if orjson is not None else 'stdlib json (orjson not installed)'}; "
+             f"compression: {'brotli + gzip' if BrotliMiddleware is not None else 'gzip only (brotli-asgi not installed)'}")
+    # Migrate once per process start; request handlers assume the schema is current.
+    if DATABASE_URL:
+        if AUTO_MIGRATE:
+            applied = await adb.migrate_schema()
+            if applied:
+                log.info(f"Applied migrations: {', '.join(applied)}")
+        else:
+            version = await adb.schema_version()
+            if version < latest_version():
+                log.warning(f"Schema is at version {version}, expected {latest_version()} (AUTO_MIGRATE=0)")
+        await adb.run_db(get_pool)  # open DB_POOL_MIN connections before the first request
+    yield
+    admin_events.close()
+    user_cache_sync.close()
+    adb.shutdown()
+    audit_writer.close()
+    close_pool()
+
+app = FastAPI(title="TrustMe AI — Web API", lifespan=lifespan, default_response_class=FastJSONResponse)
 
 if ALLOWED_ORIGIN:
     app.add_middleware(
@@ -186,45 +164,88 @@ if ALLOWED_ORIGIN:
         allow_headers=["*"],
     )
 
-# Serve static landing + dashboard for convenience
-root_dir = os.path.dirname(os.path.dirname(__file__))
-landing_dir = os.path.join(root_dir, "landing")
-app.mount("/", StaticFiles(directory=landing_dir, html=True), name="static")
+try:
+    from brotli_asgi import BrotliMiddleware
+except ImportError:
+    BrotliMiddleware = None
+    app.add_middleware(GZipMiddleware, minimum_size=COMPRESS_MIN_SIZE)
+else:
+    # Brotli for clients that accept it, gzip otherwise; streams and exports are left alone.
+    app.add_middleware(BrotliMiddleware, minimum_size=COMPRESS_MIN_SIZE, gzip_fallback=True,
+                       excluded_handlers=[r"^/admin/events", r"^/export/"])
+
 
 @app.post("/verify")
 async def verify(req: Request):
     body = await req.json()
     auth = _check_telegram_auth(body)
     # ensure exists in DB
-    ensure_user(int(auth["id"]), auth.get("username"), (auth.get("first_name") or "") + " " + (auth.get("last_name") or ""))
+    row = await adb.ensure_user(int(auth["id"]), auth.get("username"), (auth.get("first_name") or "") + " " + (auth.get("last_name") or ""))
     token = sign_jwt(auth)
-    return {"ok": True, "token": token}
+    # Role comes back with the token so the login page can redirect without a /me call.
+    return {"ok": True, "token": token, "profile": {"role": row.get("role"), "balance": str(row.get("balance"))}}
+
+async def _user_version(tid: int, user: Dict[str, Any]) -> int:
+    """The user's change counter (migrations/0009), creating their row on first sight.
+
+    Read before the data it tags, both on the primary, so a response is never
+    older than its ETag; a write landing in between only costs one extra refetch.
+    """
+    version = await adb.user_version(tid)
+    if version is None:
+        await adb.ensure_user(tid, user.get("username"), (user.get("first_name") or "") + " " + (user.get("last_name") or ""))
+        version = await adb.user_version(tid)
+    return version
 
 @app.get("/me")
 async def me(req: Request):
     user = auth_from_header(req)
     tid = int(user["sub"])
-    row = ensure_user(tid, user.get("username"), (user.get("first_name") or "") + " " + (user.get("last_name") or ""))
-    return {"ok": True, "user": {"tg_id": tid, "username": user.get("username"), "first_name": user.get("first_name"), "last_name": user.get("last_name")}, "profile": {"role": row.get("role"), "balance": str(row.get("balance"))}}
+    claims = {"tg_id": tid, "username": user.get("username"), "first_name": user.get("first_name"), "last_name": user.get("last_name")}
+    tag = _etag("me", claims, await _user_version(tid, user))
+    resp = _not_modified(req, tag)
+    if resp:
+        return resp
+    row = await adb.dashboard(tid, ("profile", "balance"))
+    return _tagged({"ok": True, "user": claims, "profile": {"role": row["role"], "balance": str(row["balance"])}}, tag)
 
 @app.get("/withdrawals")
 async def my_withdrawals(req: Request):
     user = auth_from_header(req)
     tid = int(user["sub"])
-    with get_conn() as conn:
-        with conn.cursor() as cur:
-            # resolve pk
-            cur.execute("SELECT id FROM users WHERE tg_user_id=%s", (tid,))
-            r = cur.fetchone()
-            if not r:
-                cur.execute("SELECT id FROM users WHERE tg_id=%s", (tid,))
-                r = cur.fetchone()
-            if not r:
-                return {"ok": True, "items": []}
-            uid = r["id"]
-            cur.execute("SELECT * FROM withdrawals WHERE user_id=%s ORDER BY requested_at DESC LIMIT 200", (uid,))
-            items = cur.fetchall()
-            return {"ok": True, "items": items}
+    tag = _etag("withdrawals", tid, await adb.user_version(tid))
+    return _not_modified(req, tag) or _tagged({"ok": True, "items": await adb.user_withdrawals(tid)}, tag)
+
+DASHBOARD_LIMIT = 50
+
+@app.get("/dashboard")
+async def dashboard(req: Request, fields: str = None, limit: int = DASHBOARD_LIMIT):
+    """Everything the user dashboard shows, in one round trip and one DB statement.
+
+    An unchanged poll (matching If-None-Match) only reads the user's change counter.
+    ?fields= is a comma-separated subset of profile,balance,withdrawals (default: all).
+    """
+    user = auth_from_header(req)
+    tid = int(user["sub"])
+    wanted = tuple(f for f in (fields or ",".join(DASHBOARD_FIELDS)).split(",") if f)
+    unknown = set(wanted) - set(DASHBOARD_FIELDS)
+    if unknown:
+        raise HTTPException(400, f"Unknown fields: {', '.join(sorted(unknown))}; use {','.join(DASHBOARD_FIELDS)}")
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    claims = {"tg_id": tid, "username": user.get("username"), "first_name": user.get("first_name"), "last_name": user.get("last_name")}
+    tag = _etag("dashboard", claims, wanted, limit, await _user_version(tid, user))
+    resp = _not_modified(req, tag)
+    if resp:
+        return resp
+    row = await adb.dashboard(tid, wanted, limit)
+    payload = {"ok": True, "user": claims}
+    if "profile" in wanted:
+        payload["profile"] = {"role": row["role"], "username": row["username"], "full_name": row["full_name"]}
+    if "balance" in wanted:
+        payload["balance"] = str(row["balance"])
+    if "withdrawals" in wanted:
+        payload["withdrawals"] = row["withdrawals"]
+    return _tagged(payload, tag)
 
 @app.post("/withdraw")
 async def withdraw(req: Request):
@@ -238,161 +259,159 @@ async def withdraw(req: Request):
     address = body.get("address")
     network = body.get("network","TRC20")
     tid = int(user["sub"])
-    with get_conn() as conn:
-        with conn.cursor() as cur:
-            # user row
-            cur.execute("SELECT * FROM users WHERE tg_user_id=%s", (tid,))
-            row = cur.fetchone()
-            if not row:
-                cur.execute("SELECT * FROM users WHERE tg_id=%s", (tid,))
-                row = cur.fetchone()
-            if not row:
-                row = ensure_user(tid, user.get("username"), (user.get("first_name") or "") + " " + (user.get("last_name") or ""))
-            if float(row["balance"]) < amount:
-                raise HTTPException(400, f"Insufficient balance ({row['balance']})")
-            # debit + create withdrawal
-            cur.execute("UPDATE users SET balance=balance-%s WHERE id=%s RETURNING *", (amount, row["id"]))
-            updated = cur.fetchone()
-            cur.execute("INSERT INTO withdrawals (user_id, amount, address, network) VALUES (%s,%s,%s,%s) RETURNING *", (row["id"], amount, address, network))
-            wd = cur.fetchone()
-            conn.commit()
-            return {"ok": True, "withdrawal": wd, "balance": str(updated["balance"])}
+    row = await adb.get_user_by_tg(tid) or await adb.ensure_user(tid, user.get("username"), (user.get("first_name") or "") + " " + (user.get("last_name") or ""))
+    res = await adb.request_withdrawal(row["id"], amount, address, network, actor=f"web:{tid}")
+    if not res or not res["withdrawal"]:
+        raise HTTPException(400, f"Insufficient balance ({res['balance'] if res else row['balance']})")
+    return FastJSONResponse({"ok": True, "withdrawal": res["withdrawal"], "balance": str(res["balance"])})
 
 @app.get("/admin/summary")
 async def admin_summary(req: Request):
     user = auth_from_header(req)
     tid = int(user["sub"])
-    if not is_admin(tid):
+    if not await is_admin(tid):
         raise HTTPException(403, "Admins only")
-    with get_conn() as conn:
-        with conn.cursor() as cur:
-            cur.execute("SELECT COUNT(*) AS users FROM users")
-            users = cur.fetchone()["users"]
-            cur.execute("SELECT COUNT(*) AS pending FROM withdrawals WHERE status='pending'")
-            pending = cur.fetchone()["pending"]
-            cur.execute("SELECT COALESCE(SUM(balance),0) AS total_balances FROM users")
-            tb = cur.fetchone()["total_balances"]
-            return {"ok": True, "users": users, "pending_withdrawals": pending, "total_balances": str(tb)}
+    s = await adb.admin_summary()
+    return {"ok": True, "users": s["users"], "pending_withdrawals": s["pending_withdrawals"], "total_balances": str(s["total_balances"])}
 
 
 from fastapi import Path, Body
 
-def admin_required(req: Request):
+async def admin_required(req: Request):
     user = auth_from_header(req)
     tid = int(user["sub"])
-    if not is_admin(tid):
+    if not await is_admin(tid):
         raise HTTPException(403, "Admins only")
     return tid
 
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+BATCH_MAX = 1000  # ids per batch decision
+
+def _page_limit(limit: int) -> int:
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+async def _paged(fn, *args, **kwargs):
+    # Keyset listing helpers raise ValueError on a malformed ?after= cursor.
+    try:
+        return await fn(*args, **kwargs)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+
 @app.get("/admin/users")
-async def admin_users(req: Request, limit: int = 200):
-    admin_required(req)
-    with get_conn() as conn:
-        with conn.cursor() as cur:
-            cur.execute("SELECT * FROM users ORDER BY created_at DESC LIMIT %s", (limit,))
-            return {"ok": True, "items": cur.fetchall()}
+async def admin_users(req: Request, limit: int = PAGE_SIZE, after: str = None):
+    await admin_required(req)
+    limit = _page_limit(limit)
+    v = await adb.table_versions()
+    tag = _etag("users", v["users"], limit, after)
+    resp = _not_modified(req, tag)
+    if resp:
+        return resp
+    items = await _paged(adb.list_users, limit, after=after, primary=v["primary"])
+    return _tagged({"ok": True, "items": items, "next": next_cursor(items, "created_at", limit)}, tag)
 
 @app.post("/admin/users/{user_id}/role")
 async def admin_set_role(req: Request, user_id: int = Path(...), role: str = Body(..., embed=True)):
-    admin_required(req)
+    tid = await admin_required(req)
     if role not in ("admin","manager","support","user"):
         raise HTTPException(400, "Invalid role")
-    with get_conn() as conn:
-        with conn.cursor() as cur:
-            cur.execute("UPDATE users SET role=%s WHERE id=%s RETURNING *", (role, user_id))
-            row = cur.fetchone()
-            if not row:
-                raise HTTPException(404, "User not found")
-            conn.commit()
-            return {"ok": True, "user": row}
+    row = await adb.set_user_role(user_id, role, actor=f"web:{tid}")
+    if not row:
+        raise HTTPException(404, "User not found")
+    return FastJSONResponse({"ok": True, "user": row})
 
 @app.post("/admin/users/{user_id}/balance")
 async def admin_balance(req: Request, user_id: int = Path(...), mode: str = Body(..., embed=True), amount: float = Body(0.0, embed=True)):
-    admin_required(req)
+    tid = await admin_required(req)
     if mode not in ("get","set","add","sub"):
         raise HTTPException(400, "Mode must be get|set|add|sub")
-    with get_conn() as conn:
-        with conn.cursor() as cur:
-            if mode == "get":
-                cur.execute("SELECT balance FROM users WHERE id=%s", (user_id,))
-                r = cur.fetchone()
-                if not r:
-                    raise HTTPException(404, "User not found")
-                return {"ok": True, "balance": str(r["balance"])}
-            if mode == "set":
-                cur.execute("UPDATE users SET balance=%s WHERE id=%s RETURNING balance", (amount, user_id))
-            elif mode == "add":
-                cur.execute("UPDATE users SET balance=balance+%s WHERE id=%s RETURNING balance", (amount, user_id))
-            else:
-                cur.execute("UPDATE users SET balance=balance-%s WHERE id=%s RETURNING balance", (amount, user_id))
-            r = cur.fetchone()
-            if not r:
-                raise HTTPException(404, "User not found")
-            conn.commit()
-            return {"ok": True, "balance": str(r["balance"])}
+    if mode == "get":
+        row = await adb.get_user(user_id)
+    else:
+        row = await adb.adjust_user_balance(user_id, mode, amount, actor=f"web:{tid}")
+    if not row:
+        raise HTTPException(404, "User not found")
+    return {"ok": True, "balance": str(row["balance"])}
+
+@app.post("/admin/balances/bulk")
+async def admin_balances_bulk(req: Request, dry_run: bool = False):
+    """Apply a CSV of balance changes (body: text/csv, see bot/bulk_balance.py) in one transaction."""
+    tid = await admin_required(req)
+    body = (await req.body()).decode("utf-8-sig")
+    try:
+        result = await adb.run_db(apply_balance_csv, io.StringIO(body, newline=""), f"web:{tid}", dry_run=dry_run)
+    except BulkBalanceError as e:
+        return FastJSONResponse({"ok": False, "error": str(e), "errors": [{"line": l, "problem": p} for l, p in e.errors]}, status_code=400)
+    return {"ok": True, **result}
 
 @app.get("/admin/withdrawals")
-async def admin_withdrawals(req: Request, status: str = None, limit: int = 500):
-    admin_required(req)
-    q = "SELECT w.*, u.username, u.tg_user_id FROM withdrawals w JOIN users u ON u.id=w.user_id"
-    args = []
-    if status in ("pending","approved","denied"):
-        q += " WHERE w.status=%s"
-        args.append(status)
-    q += " ORDER BY requested_at DESC LIMIT %s"
-    args.append(limit)
-    with get_conn() as conn:
-        with conn.cursor() as cur:
-            cur.execute(q, tuple(args))
-            return {"ok": True, "items": cur.fetchall()}
+async def admin_withdrawals(req: Request, status: str = None, limit: int = PAGE_SIZE, after: str = None):
+    await admin_required(req)
+    limit = _page_limit(limit)
+    status = status if status in ("pending","approved","denied") else None
+    v = await adb.table_versions()
+    tag = _etag("withdrawals", v["withdrawals"], v["users"], status, limit, after)  # rows carry username
+    resp = _not_modified(req, tag)
+    if resp:
+        return resp
+    items = await _paged(adb.list_withdrawals, status, limit, after=after, primary=v["primary"])
+    return _tagged({"ok": True, "items": items, "next": next_cursor(items, "requested_at", limit)}, tag)
 
 @app.post("/admin/withdrawals/{wid}/approve")
 async def admin_w_approve(req: Request, wid: int = Path(...), txid: str = Body(None, embed=True)):
-    admin_required(req)
-    with get_conn() as conn:
-        with conn.cursor() as cur:
-            cur.execute("SELECT * FROM withdrawals WHERE id=%s", (wid,))
-            prev = cur.fetchone()
-            if not prev:
-                raise HTTPException(404, "Withdrawal not found")
-            cur.execute("""UPDATE withdrawals
-                          SET status='approved', decided_at=NOW(), decided_by='web', txid=COALESCE(%s, txid)
-                          WHERE id=%s RETURNING *""", (txid, wid))
-            updated = cur.fetchone()
-            conn.commit()
-            return {"ok": True, "withdrawal": updated, "prev": prev}
+    tid = await admin_required(req)
+    res = await adb.decide_withdrawal(wid, "approved", f"web:{tid}", txid=txid)
+    if not res:
+        raise HTTPException(404, "Withdrawal not found")
+    prev, updated = res
+    if updated is None:
+        raise HTTPException(409, f"Withdrawal already {prev['status']}")
+    return FastJSONResponse({"ok": True, "withdrawal": updated, "prev": prev})
 
 @app.post("/admin/withdrawals/{wid}/deny")
 async def admin_w_deny(req: Request, wid: int = Path(...), note: str = Body("Denied", embed=True)):
-    admin_required(req)
-    with get_conn() as conn:
-        with conn.cursor() as cur:
-            cur.execute("SELECT * FROM withdrawals WHERE id=%s", (wid,))
-            prev = cur.fetchone()
-            if not prev:
-                raise HTTPException(404, "Withdrawal not found")
-            cur.execute("""UPDATE withdrawals
-                          SET status='denied', decided_at=NOW(), decided_by='web', note=%s
-                          WHERE id=%s RETURNING *""", (note, wid))
-            updated = cur.fetchone()
-            # auto-refund when denying pending
-            if prev.get("status") == "pending":
-                cur.execute("UPDATE users SET balance=balance+%s WHERE id=%s", (prev["amount"], prev["user_id"]))
-            conn.commit()
-            return {"ok": True, "withdrawal": updated, "refunded": prev.get("status") == "pending"}
+    tid = await admin_required(req)
+    res = await adb.decide_withdrawal(wid, "denied", f"web:{tid}", note=note)
+    if not res:
+        raise HTTPException(404, "Withdrawal not found")
+    prev, updated = res
+    if updated is None:
+        raise HTTPException(409, f"Withdrawal already {prev['status']}")
+    return FastJSONResponse({"ok": True, "withdrawal": updated, "refunded": True})
+
+@app.post("/admin/withdrawals/batch")
+async def admin_w_batch(req: Request, ids: list[int] = Body(...), action: str = Body(...), note: str = Body(None)):
+    """Approve or deny many pending withdrawals at once; ids no longer pending are reported as skipped."""
+    tid = await admin_required(req)
+    if action not in ("approve", "deny"):
+        raise HTTPException(400, "Action must be approve|deny")
+    if not ids or len(ids) > BATCH_MAX:
+        raise HTTPException(400, f"Give between 1 and {BATCH_MAX} ids")
+    status = "approved" if action == "approve" else "denied"
+    if status == "denied" and note is None:
+        note = "Denied"
+    decided, skipped = await adb.decide_withdrawals(ids, status, f"web:{tid}", note=note)
+    return FastJSONResponse({"ok": True, "decided": decided, "skipped": skipped})
+
+@app.get("/admin/stats")
+async def admin_stats(req: Request):
+    await admin_required(req)
+    return {"ok": True, "pool": pool_stats(), "replica": replica_stats(), "executor": adb.executor_stats(),
+            "user_cache": user_cache_stats(), "audit": audit_stats(),
+            "event_subscribers": admin_events.subscribers()}
 
 @app.get("/admin/logs")
-async def admin_logs(req: Request, limit: int = 200):
-    admin_required(req)
-    with get_conn() as conn:
-        with conn.cursor() as cur:
-            cur.execute("SELECT * FROM audit_logs ORDER BY created_at DESC LIMIT %s", (limit,))
-            return {"ok": True, "items": cur.fetchall()}
-
+async def admin_logs(req: Request, limit: int = PAGE_SIZE, after: str = None):
+    await admin_required(req)
+    limit = _page_limit(limit)
+    v = await adb.table_versions()
+    tag = _etag("logs", v["logs"], limit, after)
+    resp = _not_modified(req, tag)
+    if resp:
+        return resp
+    items = await _paged(adb.get_audit_logs, limit, after=after, primary=v["primary"])
+    return _tagged({"ok": True, "items": items, "next": next_cursor(items, "created_at", limit)}, tag)
 
-from fastapi.responses import StreamingResponse, PlainTextResponse
-import csv
-from io import StringIO
 
 def token_or_header(req: Request) -> str:
     # Allow Authorization header OR token=? query for CSV links
@@ -408,70 +427,232 @@ def token_or_header(req: Request) -> str:
 async def health():
     return {"ok": True}
 
-@app.get("/export/users.csv")
-async def export_users(req: Request):
+@app.get("/ready")
+async def ready():
+    try:
+        version = await adb.schema_version()
+    except Exception as e:
+        return JSONResponse({"ok": False, "error": f"database unavailable: {e}"}, status_code=503)
+    if version < latest_version():
+        return JSONResponse({"ok": False, "schema_version": version, "expected": latest_version()}, status_code=503)
+    return {"ok": True, "schema_version": version}
+
+EXPORT_CHUNK_ROWS = int(os.getenv("EXPORT_CHUNK_ROWS", "5000"))
+# A download holds a pooled connection and server-side cursor from start to finish,
+# so at most this many run at once; the rest of the pool stays free for API routes.
+EXPORT_MAX_CONCURRENT = max(1, min(int(os.getenv("EXPORT_MAX_CONCURRENT", "2")), DB_POOL_MAX - 1))
+_export_slots = threading.BoundedSemaphore(EXPORT_MAX_CONCURRENT)
+EXPORT_FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "csv.gz": ("application/gzip", "csv.gz"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+
+async def _export_admin(req: Request):
     token = token_or_header(req)
-    user = jwt.decode(token, JWT_SECRET, algorithms=["HS256"])
-    if not is_admin(int(user["sub"])):
+    try:
+        user = jwt.decode(token, JWT_SECRET, algorithms=["HS256"])
+    except Exception as e:
+        raise HTTPException(401, f"Invalid token: {e}")
+    if not await is_admin(int(user["sub"])):
         raise HTTPException(403, "Admins only")
-    with get_conn() as conn:
-        with conn.cursor() as cur:
-            cur.execute("SELECT id, tg_user_id, username, full_name, role, balance, created_at FROM users ORDER BY created_at DESC")
-            rows = cur.fetchall()
-    buf = StringIO()
-    w = csv.DictWriter(buf, fieldnames=["id","tg_user_id","username","full_name","role","balance","created_at"])
-    w.writeheader()
-    for r in rows:
-        w.writerow(r)
-    buf.seek(0)
-    return PlainTextResponse(buf.read(), media_type="text/csv", headers={"Content-Disposition":"attachment; filename=users.csv"})
+
+def _row_batches(sql: str, args=()):
+    """Yield (cursor.description, rows) from a server-side cursor, EXPORT_CHUNK_ROWS at a time."""
+    with read_connection() as conn:
+        with conn.cursor(name=f"export_{os.getpid()}_{id(conn)}") as cur:
+            cur.itersize = EXPORT_CHUNK_ROWS
+            cur.execute(sql, args)
+            while True:
+                rows = cur.fetchmany(EXPORT_CHUNK_ROWS)
+                yield cur.description, rows
+                if len(rows) < EXPORT_CHUNK_ROWS:
+                    break
+
+def _holding_slot(chunks, batches):
+    """Iterate `chunks`, giving back the export slot when done, failed or dropped unstarted."""
+    def body():
+        try:
+            yield from chunks
+        finally:
+            batches.close()  # end the server-side cursor before its connection goes back
+            release()
+    gen = body()
+    release = weakref.finalize(gen, _export_slots.release)  # runs once, whichever comes first
+    return gen
+
+class _ExportResponse(StreamingResponse):
+    """Streams an export and closes its body when the download ends, however it ends.
+
+    Starlette drops a sync body unclosed when the client disconnects. Left to the GC,
+    the pooled connection could be rolled back and handed out again before the
+    generator holding its server-side cursor is finalized.
+    """
+    def __init__(self, chunks, **kwargs):
+        super().__init__(chunks, **kwargs)
+        self._chunks = chunks
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            with anyio.CancelScope(shield=True):
+                await run_in_threadpool(self._chunks.close)
+
+def _csv_value(v):
+    return json.dumps(v) if isinstance(v, (dict, list)) else v
+
+def _csv_chunks(batches):
+    buf = io.StringIO()
+    w = csv.writer(buf)
+    header = False
+    for description, rows in batches:
+        if not header:
+            w.writerow([d.name for d in description])
+            header = True
+        for r in rows:
+            w.writerow([_csv_value(v) for v in r.values()])
+        yield buf.getvalue().encode("utf-8")
+        buf.seek(0)
+        buf.truncate(0)
+
+def _gzip_chunks(chunks):
+    z = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31: gzip container
+    for chunk in chunks:
+        out = z.compress(chunk)
+        if out:
+            yield out
+    yield z.flush()
+
+class _Spool(io.RawIOBase):
+    """Write-only sink that hands back what was written since the last drain."""
+    def __init__(self):
+        self._parts, self._pos = [], 0
+    def writable(self):
+        return True
+    def write(self, b):
+        self._parts.append(bytes(b))
+        self._pos += len(b)
+        return len(b)
+    def tell(self):
+        return self._pos
+    def drain(self) -> bytes:
+        out, self._parts = b"".join(self._parts), []
+        return out
+
+# Postgres type OID -> Arrow type for parquet exports; anything else becomes a string.
+_ARROW_TYPES = {20: "int64", 21: "int64", 23: "int64", 16: "bool_", 701: "float64", 700: "float64"}
+
+def _arrow_schema(pa, description):
+    fields = []
+    for d in description:
+        if d.type_code in _ARROW_TYPES:
+            t = getattr(pa, _ARROW_TYPES[d.type_code])()
+        elif d.type_code == 1700:
+            t = pa.decimal128(38, 6)
+        elif d.type_code in (1184, 1114):
+            t = pa.timestamp("us", tz="UTC" if d.type_code == 1184 else None)
+        else:
+            t = pa.string()
+        fields.append(pa.field(d.name, t))
+    return pa.schema(fields)
+
+def _parquet_chunks(batches):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    sink = _Spool()
+    writer = None
+    for description, rows in batches:
+        if writer is None:
+            writer = pq.ParquetWriter(sink, _arrow_schema(pa, description))
+        if rows:
+            data = {d.name: [_csv_value(r[d.name]) for r in rows] for d in description}
+            writer.write_table(pa.table(data, schema=writer.schema))
+        yield sink.drain()
+    if writer is not None:
+        writer.close()
+    yield sink.drain()
+
+async def _export(req: Request, name: str, sql: str):
+    await _export_admin(req)
+    fmt = req.query_params.get("format", "csv")
+    if fmt not in EXPORT_FORMATS:
+        raise HTTPException(400, f"format must be one of {'|'.join(EXPORT_FORMATS)}")
+    if fmt == "parquet":
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise HTTPException(400, "Parquet export requires pyarrow on the server")
+        batches = _row_batches(sql)
+        body = _parquet_chunks(batches)
+    else:
+        batches = _row_batches(sql)
+        body = _csv_chunks(batches)
+        if fmt == "csv.gz":
+            body = _gzip_chunks(body)
+    if not _export_slots.acquire(blocking=False):
+        raise HTTPException(503, f"{EXPORT_MAX_CONCURRENT} exports already running; retry shortly",
+                            headers={"Retry-After": "10"})
+    media_type, ext = EXPORT_FORMATS[fmt]
+    return _ExportResponse(_holding_slot(body, batches), media_type=media_type,
+                          headers={"Content-Disposition": f"attachment; filename={name}.{ext}"})
+
+@app.get("/export/users.csv")
+async def export_users(req: Request):
+    return await _export(req, "users", "SELECT id, tg_user_id, username, full_name, role, balance, created_at FROM users ORDER BY created_at DESC, id DESC")
 
 @app.get("/export/withdrawals.csv")
 async def export_withdrawals(req: Request):
-    token = token_or_header(req)
-    user = jwt.decode(token, JWT_SECRET, algorithms=["HS256"])
-    if not is_admin(int(user["sub"])):
-        raise HTTPException(403, "Admins only")
-    with get_conn() as conn:
-        with conn.cursor() as cur:
-            cur.execute("""SELECT w.*, u.username, u.tg_user_id
-                            FROM withdrawals w JOIN users u ON u.id=w.user_id
-                            ORDER BY requested_at DESC""")
-            rows = cur.fetchall()
-    buf = StringIO()
-    if rows:
-        fields = list(rows[0].keys())
-    else:
-        fields = ["id","user_id","amount","address","network","status","requested_at","decided_at","decided_by","txid","note","username","tg_user_id"]
-    w = csv.DictWriter(buf, fieldnames=fields)
-    w.writeheader()
-    for r in rows:
-        w.writerow(r)
-    buf.seek(0)
-    return PlainTextResponse(buf.read(), media_type="text/csv", headers={"Content-Disposition":"attachment; filename=withdrawals.csv"})
+    return await _export(req, "withdrawals", """SELECT w.*, u.username, u.tg_user_id
+                                           FROM withdrawals w JOIN users u ON u.id=w.user_id
+                                           ORDER BY w.requested_at DESC, w.id DESC""")
 
 @app.get("/export/logs.csv")
 async def export_logs(req: Request):
-    token = token_or_header(req)
-    user = jwt.decode(token, JWT_SECRET, algorithms=["HS256"])
-    if not is_admin(int(user["sub"])):
-        raise HTTPException(403, "Admins only")
-    with get_conn() as conn:
-        with conn.cursor() as cur:
-            cur.execute("SELECT * FROM audit_logs ORDER BY created_at DESC")
-            rows = cur.fetchall()
-    buf = StringIO()
-    if rows:
-        fields = list(rows[0].keys())
-    else:
-        fields = ["id","actor","action","entity_type","entity_id","meta","created_at"]
-    w = csv.DictWriter(buf, fieldnames=fields)
-    w.writeheader()
-    for r in rows:
-        # ensure JSON is stringified
-        if isinstance(r.get("meta"), dict):
-            r = dict(r)
-            r["meta"] = json.dumps(r["meta"])
-        w.writerow(r)
-    buf.seek(0)
-    return PlainTextResponse(buf.read(), media_type="text/csv", headers={"Content-Disposition":"attachment; filename=logs.csv"})
+    return await _export(req, "logs", "SELECT * FROM audit_logs ORDER BY created_at DESC, id DESC")
+
+SSE_KEEPALIVE = 15  # seconds between comment lines, keeps proxies from closing idle streams
+
+def _sse(event: str, data) -> str:
+    # Same encoding as the JSON routes, so pushed rows match what the list endpoints return.
+    return f"event: {event}\ndata: {dumps(data).decode()}\n\n"
+
+@app.get("/admin/events")
+async def admin_events_stream(req: Request):
+    """Server-sent events: users / withdrawals rows as they change, plus summary and resync."""
+    await _export_admin(req)  # EventSource cannot set headers, so ?token= is accepted here too
+    q = admin_events.subscribe()
+
+    async def stream():
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    event, data = await asyncio.wait_for(q.get(), SSE_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    if await req.is_disconnected():
+                        return
+                    yield ": keepalive\n\n"
+                    continue
+                yield _sse(event, data)
+        finally:
+            admin_events.unsubscribe(q)
+
+    return StreamingResponse(stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.get("/export/{source}/delta")
+async def export_delta(req: Request, source: str, since: str = None, limit: int = 1000):
+    """Incremental sync: rows created/changed after `since`, plus the cursor for the next call."""
+    await _export_admin(req)
+    if source not in ("users", "withdrawals", "logs"):
+        raise HTTPException(404, "Unknown export")
+    limit = max(1, min(limit, 10000))
+    items, nxt = await _paged(adb.list_changes, source, since, limit)
+    return FastJSONResponse({"ok": True, "items": items, "next": nxt, "has_more": len(items) == limit})
+
+# Serve static landing + dashboard for convenience. Mounted last: a mount at "/"
+# matches every path, so any route registered after it would be unreachable.
+root_dir = os.path.dirname(os.path.dirname(__file__))
+landing_dir = os.path.join(root_dir, "landing")
+app.mount("/", StaticFiles(directory=landing_dir, html=True), name="static")
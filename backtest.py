@@ -1,23 +1,47 @@
+import numpy as np
 import pandas as pd
 
-def run_csv_backtest(filepath, initial_investment=150):
+BACKTEST_CHUNK_ROWS = 100_000
+
+def _add_daily(day_profit, df):
+    # Per-day profit totals, summed in file order and carried across chunks so any
+    # chunking gives the same numbers as one pass over the whole file.
+    for day, profit in df.groupby('day', sort=False)['profit']:
+        buf = np.empty(len(profit) + 1)
+        buf[0] = day_profit.get(day, 0.0)
+        buf[1:] = profit.to_numpy(dtype=float)
+        day_profit[day] = float(np.cumsum(buf)[-1])
+
+def run_csv_backtest(filepath, initial_investment=150, chunksize=None):
+    """Replay a day/trade/profit CSV from `initial_investment`.
+
+    Returns (daily history, trade records, summary). With `chunksize` the file is
+    read that many rows at a time, so memory stays bounded however large it is;
+    history and summary are identical, but trade records are not kept (empty list).
+    """
     try:
-        df = pd.read_csv(filepath)
-        df = df.dropna()  # ✅ remove bad rows
+        chunks = pd.read_csv(filepath, chunksize=chunksize) if chunksize else [pd.read_csv(filepath)]
+        day_profit = {}
+        trades = 0
+        records = []
 
+        for df in chunks:
+            df = df.dropna()  # ✅ remove bad rows
 
-        if not all(col in df.columns for col in ['day', 'trade', 'profit']):
-            raise ValueError("CSV must contain 'day', 'trade', 'profit' columns")
+            if not all(col in df.columns for col in ['day', 'trade', 'profit']):
+                raise ValueError("CSV must contain 'day', 'trade', 'profit' columns")
+
+            _add_daily(day_profit, df)
+            trades += len(df)
+            if not chunksize:
+                records = df.to_dict(orient="records")
 
         investment = initial_investment
         history = []
 
-        for day in sorted(df['day'].unique()):
-            day_data = df[df['day'] == day]
+        for day in sorted(day_profit):
             start = investment
-
-            for _, row in day_data.iterrows():
-                investment += row['profit']
+            investment += day_profit[day]
 
             history.append({
                 "day": day,
@@ -30,10 +54,10 @@ def run_csv_backtest(filepath, initial_investment=150):
             "Starting Balance": initial_investment,
             "Final Balance": round(investment, 2),
             "Total Days": len(history),
-            "Total Trades": len(df)
+            "Total Trades": trades
         }
 
-        return history, df.to_dict(orient="records"), summary
+        return history, records, summary
 
     except Exception as e:
         print("❌ Backtest failed:", e)
@@ -0,0 +1,224 @@
+"""Background writer for audit_logs.
+
+log_action() only enqueues; a daemon thread inserts queued entries in batches
+(one multi-row INSERT) whenever AUDIT_BATCH_SIZE entries are waiting or
+AUDIT_FLUSH_INTERVAL seconds have passed. The queue is flushed at interpreter
+exit and on close(). If the queue is full the entry is written synchronously
+rather than dropped. A batch that still fails after retries is appended to
+AUDIT_SPILL_PATH (JSON lines) and inserted from there once the database is back,
+by whichever process gets to it first.
+
+Entries still queued when a process is killed are lost, so this is only for
+best-effort records: withdrawal decisions, balance and role changes write their
+audit row in their own transaction (bot/db.py).
+"""
+import os
+import json
+import time
+import queue
+import atexit
+import logging
+import threading
+
+import psycopg2.extras
+
+from .pool import get_pool
+
+log = logging.getLogger("trustmeai.audit")
+
+AUDIT_QUEUE_SIZE = int(os.getenv("AUDIT_QUEUE_SIZE", "10000"))
+AUDIT_BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", "200"))
+AUDIT_FLUSH_INTERVAL = float(os.getenv("AUDIT_FLUSH_INTERVAL", "1.0"))  # seconds
+AUDIT_SPILL_PATH = os.getenv("AUDIT_SPILL_PATH", "state/audit_spill.jsonl")
+
+_INSERT = "INSERT INTO audit_logs (actor, action, entity_type, entity_id, meta) VALUES %s"
+
+def _insert(rows: list):
+    with get_pool().connection() as conn:
+        with conn.cursor() as cur:
+            psycopg2.extras.execute_values(cur, _INSERT, rows, template="(%s,%s,%s,%s,%s::jsonb)", page_size=len(rows))
+
+class AuditWriter:
+    def __init__(self, maxsize: int = AUDIT_QUEUE_SIZE, batch_size: int = AUDIT_BATCH_SIZE,
+                 interval: float = AUDIT_FLUSH_INTERVAL, spill_path: str = AUDIT_SPILL_PATH):
+        self.batch_size = max(1, batch_size)
+        self.interval = interval
+        self.spill_path = spill_path
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._flush_now = threading.Event()
+        self._stats = {"written": 0, "batches": 0, "failed": 0, "spilled": 0, "replayed": 0, "sync_writes": 0}
+
+    def _ensure_started(self):
+        if self._thread is None or not self._thread.is_alive():
+            with self._start_lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._stop.clear()
+                    self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+                    self._thread.start()
+
+    def submit(self, actor, action, entity_type=None, entity_id=None, meta=None):
+        # Serialise now: callers may mutate meta afterwards, and rows carry Decimal/datetime.
+        row = (actor, action, entity_type, entity_id, json.dumps(meta or {}, default=str))
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            self._stats["sync_writes"] += 1
+            _insert([row])
+
+    def _write(self, batch: list):
+        for attempt in range(3):
+            try:
+                _insert(batch)
+                break
+            except Exception as e:
+                log.warning(f"Audit flush of {len(batch)} rows failed ({e}); attempt {attempt + 1}/3")
+                time.sleep(0.5 * (attempt + 1))
+        else:
+            self._stats["failed"] += len(batch)
+            self._spill(batch)
+            return
+        self._stats["written"] += len(batch)
+        self._stats["batches"] += 1
+        self._try_replay()
+
+    def _append(self, rows: list):
+        os.makedirs(os.path.dirname(self.spill_path) or ".", exist_ok=True)
+        with open(self.spill_path, "a", encoding="utf-8") as f:
+            f.write("".join(json.dumps(row) + "\n" for row in rows))
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _spill(self, batch: list):
+        try:
+            self._append(batch)
+        except OSError as e:
+            log.error(f"Dropped {len(batch)} audit rows, could not spill them to {self.spill_path} ({e}): {batch!r}")
+            return
+        self._stats["spilled"] += len(batch)
+        log.error(f"Spilled {len(batch)} audit rows to {self.spill_path} after retries")
+
+    def _claimed(self) -> list:
+        # Files left by a replay that died half way (its process is gone); rows may repeat.
+        out = []
+        folder, base = os.path.split(self.spill_path)
+        for name in os.listdir(folder or "."):
+            pid = name[len(base) + 1:]
+            if name.startswith(base + ".") and pid.isdigit() and int(pid) != os.getpid():
+                try:
+                    os.kill(int(pid), 0)
+                except ProcessLookupError:
+                    out.append(os.path.join(folder, name))
+                except OSError:
+                    pass
+        return out
+
+    def _replay(self):
+        """Insert rows spilled by earlier failures, in any process sharing the file."""
+        if not self.spill_path or not os.path.isdir(os.path.dirname(self.spill_path) or "."):
+            return
+        mine = f"{self.spill_path}.{os.getpid()}"
+        for path in [self.spill_path] + self._claimed():
+            try:
+                os.replace(path, mine)  # only one process gets to claim each file
+            except OSError:
+                continue
+            rows, bad = [], []
+            with open(mine, encoding="utf-8", errors="replace") as f:
+                for line in f:
+                    if line.strip():
+                        try:
+                            row = json.loads(line)
+                        except ValueError:
+                            row = None
+                        if isinstance(row, list) and len(row) == 5:
+                            rows.append(tuple(row))
+                        else:
+                            bad.append(line if line.endswith("\n") else line + "\n")
+            if bad:
+                # A torn or corrupt line must not block the rest; keep it aside for inspection.
+                log.error(f"Moved {len(bad)} undecodable spilled audit rows to {self.spill_path}.bad")
+                with open(f"{self.spill_path}.bad", "a", encoding="utf-8") as f:
+                    f.write("".join(bad))
+            done = 0
+            try:
+                while done < len(rows):
+                    _insert(rows[done:done + self.batch_size])
+                    done = min(done + self.batch_size, len(rows))
+            except Exception as e:
+                log.warning(f"Replaying spilled audit rows failed ({e}); keeping {len(rows) - done} for later")
+                try:
+                    self._append(rows[done:])
+                except OSError:
+                    return  # still in `mine`; picked up again after this process exits
+            self._stats["replayed"] += done
+            os.remove(mine)
+            if done:
+                log.info(f"Replayed {done} spilled audit rows")
+
+    def _try_replay(self):
+        try:
+            self._replay()
+        except Exception as e:
+            log.warning(f"Could not replay spilled audit rows ({e})")
+
+    def _run(self):
+        self._try_replay()
+        batch, deadline = [], None
+        while True:
+            wait = 0.5 if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                batch.append(self._queue.get(timeout=wait))
+                while len(batch) < self.batch_size:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                pass
+            if batch and deadline is None:
+                deadline = time.monotonic() + self.interval
+            urgent = self._stop.is_set() or self._flush_now.is_set()
+            if batch and (len(batch) >= self.batch_size or time.monotonic() >= deadline or urgent):
+                try:
+                    self._write(batch)
+                finally:
+                    for _ in batch:
+                        self._queue.task_done()
+                batch, deadline = [], None
+            if self._stop.is_set() and not batch and self._queue.empty():
+                return
+
+    def flush(self):
+        """Block until everything queued so far has been written."""
+        if not self._queue.unfinished_tasks:
+            return
+        self._ensure_started()
+        self._flush_now.set()
+        try:
+            self._queue.join()
+        finally:
+            self._flush_now.clear()
+
+    def close(self):
+        if self._thread is not None and self._thread.is_alive():
+            self._stop.set()
+            self._thread.join()
+        # Anything submitted after the thread exited
+        rest = []
+        while True:
+            try:
+                rest.append(self._queue.get_nowait())
+                self._queue.task_done()
+            except queue.Empty:
+                break
+        if rest:
+            self._write(rest)
+
+    def stats(self) -> dict:
+        out = dict(self._stats)
+        out["queue_depth"] = self._queue.qsize()
+        return out
+
+audit_writer = AuditWriter()
+atexit.register(audit_writer.close)
@@ -0,0 +1,76 @@
+"""Benchmark the /summary analytics against the old pandas implementation.
+
+    python -m bot.bench_summary [--trades 1000000] [--repeat 5]
+
+Times, on the same random PnL series:
+  pandas      the previous summarize_df (Series ops, cumsum/cummax)
+  numpy       summarize_array on a float64 array
+  read_csv    pandas reading that CSV and summarizing it, as every call used to
+  csv cold    TradeStats building its totals from a CSV of that many rows
+  csv cached  TradeStats.update() again with the file unchanged
+and checks the figures agree.
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from .summary import summarize_array
+from .trade_stats import TradeStats
+
+def summarize_pandas(df: pd.DataFrame) -> dict:
+    """summarize_df as it was before the NumPy version, kept as the reference."""
+    pnl = df['pnl'].fillna(0).astype(float); wins = pnl[pnl > 0]; losses = pnl[pnl < 0]; n = len(df)
+    cum = pnl.cumsum(); dd = cum - cum.cummax()
+    gp = float(wins.sum()) if len(wins) else 0.0; gl = float(-losses.sum()) if len(losses) else 0.0
+    return {'trades': n, 'wins': int((pnl > 0).sum()), 'losses': int((pnl < 0).sum()), 'win_rate': len(wins) / n * 100.0,
+            'net_pnl': float(pnl.sum()), 'avg_win': float(wins.mean()) if len(wins) else 0.0,
+            'avg_loss': float(losses.mean()) if len(losses) else 0.0, 'max_drawdown': float(dd.min()),
+            'profit_factor': gp / gl if gl > 0 else 0.0}
+
+def _best(fn, repeat: int) -> tuple:
+    best, out = float("inf"), None
+    for _ in range(repeat):
+        t = time.perf_counter()
+        out = fn()
+        best = min(best, time.perf_counter() - t)
+    return best, out
+
+def _same(a: dict, b: dict) -> bool:
+    return all(abs(a[k] - b[k]) <= 1e-6 * max(1.0, abs(a[k])) for k in a)
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog="python -m bot.bench_summary", description=__doc__.splitlines()[0])
+    ap.add_argument("--trades", type=int, default=1_000_000)
+    ap.add_argument("--repeat", type=int, default=5)
+    args = ap.parse_args(argv)
+
+    rng = np.random.default_rng(7)
+    pnl = rng.normal(0.5, 25.0, args.trades).round(2)
+    df = pd.DataFrame({"pnl": pnl})
+
+    t_pd, ref = _best(lambda: summarize_pandas(df), args.repeat)
+    t_np, got = _best(lambda: summarize_array(pnl), args.repeat)
+    print(f"{args.trades:,} trades")
+    print(f"  pandas      {t_pd * 1000:9.1f} ms")
+    print(f"  numpy       {t_np * 1000:9.1f} ms  ({t_pd / t_np:.1f}x){'' if _same(ref, got) else '  MISMATCH'}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "trades.csv")
+        pd.DataFrame({"id": np.arange(args.trades), "symbol": "BTCUSDT", "pnl": pnl}).to_csv(path, index=False)
+        t_read, _ = _best(lambda: summarize_pandas(pd.read_csv(path)), 1)
+        t_cold, got = _best(lambda: TradeStats(path, state_path=None).update(), 1)
+        stats = TradeStats(path, state_path=None)
+        stats.update()
+        t_hot, _ = _best(stats.update, args.repeat)
+    print(f"  read_csv    {t_read * 1000:9.1f} ms  (pandas over the whole file, the old per-call cost)")
+    print(f"  csv cold    {t_cold * 1000:9.1f} ms  (TradeStats first build){'' if _same(ref, got) else '  MISMATCH'}")
+    print(f"  csv cached  {t_hot * 1e6:9.1f} us  (TradeStats, file unchanged)")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,11 +1,18 @@
 import os
+import asyncio
 import logging
-import csv
 
 from telegram import Update
 from telegram.ext import Application, CommandHandler, ContextTypes
 
-from .db import ensure_user, find_user, set_user_role, adjust_user_balance, update_withdrawal_status, log_action, migrate_schema, create_withdrawal, get_or_create_user, _get_user_pk_by_tg, get_withdrawal
+from .pool import close_pool
+from .audit import audit_writer
+from .cache import user_cache_sync
+from . import db_async as adb
+from .trade_stats import TradeStats
+from .summary import format_summary
+from .tail import tail_lines
+from .graph import graph_cache
 
 logging.basicConfig(level=logging.INFO)
 log = logging.getLogger("trustmeai.bot")
@@ -30,6 +37,8 @@ PORT = int(os.getenv("PORT", "8080"))
 APP_TOKEN_IN_PATH = int(os.getenv("APP_TOKEN_IN_PATH", "0")) == 1
 TRADES_PATH = os.getenv("TRADES_PATH", "trades.csv")
 WEBHOOK_PATH = os.getenv("WEBHOOK_PATH")  # optional override
+AUTO_MIGRATE = os.getenv("AUTO_MIGRATE", "1") == "1"
+trade_stats = TradeStats(TRADES_PATH)
 
 def _parse_admin_ids_env():
     raw = os.getenv("ADMIN_IDS", "").replace(";", ",").replace(" ", ",")
@@ -45,12 +54,11 @@ def _parse_admin_ids_env():
     return ids
 ADMIN_IDS = _parse_admin_ids_env()
 
-def is_admin(user_id: int) -> bool:
+async def is_admin(user_id: int) -> bool:
     if user_id in ADMIN_IDS:
         return True
     try:
-        row = ensure_user(user_id)
-        return row and row.get("role") in ("admin", "manager")
+        return await adb.get_user_role(user_id) in ("admin", "manager")
     except Exception:
         return False
 
@@ -58,7 +66,7 @@ def is_admin(user_id: int) -> bool:
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     u = update.effective_user
-    ensure_user(u.id, u.username, u.full_name)
+    await adb.ensure_user(u.id, u.username, u.full_name)
     await update.message.reply_html(
         f"""👋 Welcome <b>{u.first_name}</b>!
 <b>TrustMe AI</b> bot is online.
@@ -67,134 +75,191 @@ Use /summary, /log, /graph to review performance.
 
 async def summary(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
-        total = 0.0
-        wins = 0
-        losses = 0
-        with open(TRADES_PATH, "r", encoding="utf-8") as f:
-            r = csv.DictReader(f)
-            for row in r:
-                pnl = float(row.get("pnl", "0") or 0)
-                total += pnl
-                if pnl >= 0:
-                    wins += 1
-                else:
-                    losses += 1
-        await update.message.reply_html(
-            f"""<b>Performance Summary</b>
-Total PnL: <b>{total:.2f}</b>
-Wins: <b>{wins}</b> • Losses: <b>{losses}</b>""")
+        s = await asyncio.to_thread(trade_stats.update)
     except FileNotFoundError:
-        await update.message.reply_text("No trades file found.")
+        return await update.message.reply_text("No trades file found.")
+    await update.message.reply_html(format_summary(s, {"path": TRADES_PATH}))
+
+LOG_LINES = 15
 
 async def log_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     import html
+    # /log [n] [offset]: the last n rows, or the n rows before a byte offset from an earlier reply
+    try:
+        n = min(max(int(context.args[0]), 1), 50) if context.args else LOG_LINES
+        before = int(context.args[1]) if len(context.args) > 1 else None
+    except ValueError:
+        return await update.message.reply_text("Usage: /log [rows] [offset]")
     try:
-        with open(TRADES_PATH, "r", encoding="utf-8") as f:
-            lines = f.readlines()[-16:]
-        safe = html.escape("".join(lines))
-        await update.message.reply_html(f"<pre><code>{safe}</code></pre>")
+        header, lines, offset = await asyncio.to_thread(tail_lines, TRADES_PATH, n, before)
     except FileNotFoundError:
-        await update.message.reply_text("No trades file found.")
+        return await update.message.reply_text("No trades file found.")
+    safe = html.escape("\n".join([header] + lines))
+    more = f"\nOlder: /log {n} {offset}" if offset is not None else ""
+    await update.message.reply_html(f"<pre><code>{safe}</code></pre>{more}")
 
 async def graph(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    await update.message.reply_text("Graph endpoint pending — use admin panel for now.")
+    # /graph [n]: equity curve of the whole log, or of its last n trades
+    try:
+        last = max(int(context.args[0]), 2) if context.args else None
+    except ValueError:
+        return await update.message.reply_text("Usage: /graph [last_n_trades]")
+    try:
+        s = await asyncio.to_thread(trade_stats.update)
+        if not s["trades"]:
+            return await update.message.reply_text("No trades yet.")
+        png = await graph_cache.equity_png(TRADES_PATH, s["trades"], last=last)
+    except FileNotFoundError:
+        return await update.message.reply_text("No trades file found.")
+    except Exception:
+        log.exception("Equity chart render failed")
+        return await update.message.reply_text("Could not draw the chart right now; try again later.")
+    shown = f"last {last} of {s['trades']}" if last and last < s["trades"] else str(s["trades"])
+    caption = f"Equity curve — {shown} trades, total net PnL {s['net_pnl']:.2f}"
+    file_id = graph_cache.file_id(png)
+    if file_id:
+        # Telegram already has this exact image: no re-upload
+        return await update.message.reply_photo(file_id, caption=caption)
+    with open(png, "rb") as f:
+        msg = await update.message.reply_photo(f, caption=caption)
+    graph_cache.remember(png, msg.photo[-1].file_id)
 
 async def my_balance(update: Update, context: ContextTypes.DEFAULT_TYPE):
     u = update.effective_user
-    row = ensure_user(u.id, u.username, u.full_name)
+    row = await adb.ensure_user(u.id, u.username, u.full_name)
     await update.message.reply_html(f"Your balance: <b>{row['balance']}</b>")
 
 # --- Admin Commands ---
 
 async def approve_withdraw(update: Update, context: ContextTypes.DEFAULT_TYPE):
     uid = update.effective_user.id
-    if not is_admin(uid):
+    if not await is_admin(uid):
         return await update.message.reply_text("Admins only.")
-    if not context.args:
+    if not context.args or not context.args[0].isdigit():
         return await update.message.reply_text("Usage: /approve_withdraw <withdrawal_id> [txid]")
     wid = int(context.args[0])
     txid = context.args[1] if len(context.args) > 1 else None
-    before = {"id": wid}
-    updated = update_withdrawal_status(wid, "approved", f"tg:{uid}", txid, None)
-    log_action(f"tg:{uid}", "withdrawal_approve", "withdrawal", str(wid), {"before": before, "after": updated})
+    # Locked, pending-only decision and its audit row in one transaction (same as the web API)
+    res = await adb.decide_withdrawal(wid, "approved", f"tg:{uid}", txid=txid)
+    if not res:
+        return await update.message.reply_text("Withdrawal not found.")
+    prev, updated = res
+    if updated is None:
+        return await update.message.reply_text(f"Withdrawal #{wid} is already {prev['status']}.")
     await update.message.reply_text(f"Approved withdrawal #{wid}")
 
 async def deny_withdraw(update: Update, context: ContextTypes.DEFAULT_TYPE):
     uid = update.effective_user.id
-    if not is_admin(uid):
+    if not await is_admin(uid):
         return await update.message.reply_text("Admins only.")
-    if not context.args:
+    if not context.args or not context.args[0].isdigit():
         return await update.message.reply_text("Usage: /deny_withdraw <withdrawal_id> [reason]")
     wid = int(context.args[0])
     note = " ".join(context.args[1:]) if len(context.args) > 1 else "Denied"
 
-    prev = get_withdrawal(wid)
-    if not prev:
+    # Status change and refund commit together, and only while still pending
+    res = await adb.decide_withdrawal(wid, "denied", f"tg:{uid}", note=note)
+    if not res:
         return await update.message.reply_text("Withdrawal not found.")
-    updated = update_withdrawal_status(wid, "denied", f"tg:{uid}", None, note)
-
-    # refund only if moving from pending -> denied
-    if prev.get("status") == "pending":
-        try:
-            adjust_user_balance(prev["user_id"], "add", float(prev["amount"]))
-        except Exception as e:
-            log.warning(f"Refund failed for withdrawal {wid}: {e}")
-    log_action(f"tg:{uid}", "withdrawal_deny", "withdrawal", str(wid), {"before": prev, "after": updated})
-    await update.message.reply_text(f"Denied withdrawal #{wid} and refunded balance.")
+    prev, updated = res
+    if updated is None:
+        return await update.message.reply_text(f"Withdrawal #{wid} is already {prev['status']}.")
+    await update.message.reply_text(f"Denied withdrawal #{wid} and refunded {prev['amount']}.")
+
+def _batch_ids(args) -> tuple:
+    # Leading numeric args (commas allowed: "/approve_batch 4,5 9") are ids; the rest is free text.
+    ids, rest = [], list(args)
+    while rest and all(p.isdigit() for p in rest[0].split(",") if p):
+        ids += [int(p) for p in rest.pop(0).split(",") if p]
+    return ids, " ".join(rest)
+
+async def _decide_batch(update: Update, context: ContextTypes.DEFAULT_TYPE, status: str):
+    uid = update.effective_user.id
+    if not await is_admin(uid):
+        return await update.message.reply_text("Admins only.")
+    ids, note = _batch_ids(context.args)
+    cmd = "approve_batch <id> [<id> ...]" if status == "approved" else "deny_batch <id> [<id> ...] [reason]"
+    if not ids:
+        return await update.message.reply_text(f"Usage: /{cmd}")
+    decided, skipped = await adb.decide_withdrawals(ids, status, f"tg:{uid}", note or ("Denied" if status == "denied" else None))
+    text = f"{status.capitalize()} {len(decided)} withdrawal(s)"
+    if status == "denied" and decided:
+        text += f", refunded {sum(r['amount'] for r in decided)}"
+    if skipped:
+        text += f". Skipped (not pending or not found): {', '.join(map(str, skipped))}"
+    await update.message.reply_text(text)
+
+async def approve_batch(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await _decide_batch(update, context, "approved")
+
+async def deny_batch(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await _decide_batch(update, context, "denied")
 
 async def balance_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     uid = update.effective_user.id
-    if not is_admin(uid):
+    if not await is_admin(uid):
         return await update.message.reply_text("Admins only.")
     if len(context.args) < 2:
         return await update.message.reply_text("Usage: /balance <tg_id|@user> <get|set|add|sub> [amount]")
     ident, mode = context.args[0], context.args[1]
     amount = float(context.args[2]) if len(context.args) > 2 else 0.0
-    user = find_user(ident)
+    user = await adb.find_user(ident)
     if not user:
         return await update.message.reply_text("User not found.")
     if mode == "get":
         return await update.message.reply_text(f"Balance: {user['balance']}")
-    before = user.copy()
-    updated = adjust_user_balance(user['id'], mode, amount)
-    log_action(f"tg:{uid}", f"balance_{mode}", "user", str(user['id']), {"before": before, "after": updated, "amount": amount})
+    if mode not in ("set", "add", "sub"):
+        return await update.message.reply_text("Mode must be get|set|add|sub.")
+    updated = await adb.adjust_user_balance(user['id'], mode, amount, actor=f"tg:{uid}")
     await update.message.reply_text(f"Updated balance → {updated['balance']}")
 
 async def set_role_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     uid = update.effective_user.id
-    if not is_admin(uid):
+    if not await is_admin(uid):
         return await update.message.reply_text("Admins only.")
     if len(context.args) < 2:
         return await update.message.reply_text("Usage: /set_role <tg_id|@user> <admin|manager|support|user>")
     ident, role = context.args[0], context.args[1]
-    user = find_user(ident)
+    user = await adb.find_user(ident)
     if not user:
         return await update.message.reply_text("User not found.")
-    before = user.copy()
-    updated = set_user_role(user['id'], role)
-    log_action(f"tg:{uid}", "role_set", "user", str(user['id']), {"before": before, "after": updated})
+    updated = await adb.set_user_role(user['id'], role, actor=f"tg:{uid}")
+    if not updated:
+        return await update.message.reply_text("User not found.")
     await update.message.reply_text(f"Role set → {role}")
 
 async def whoami(update: Update, context: ContextTypes.DEFAULT_TYPE):
     u = update.effective_user
-    ensure_user(u.id, u.username, u.full_name)
+    await adb.ensure_user(u.id, u.username, u.full_name)
     handle = f"@{u.username}" if u.username else "—"
     await update.message.reply_html(f"<b>ID:</b> {u.id}\n<b>Username:</b> {handle}\n<b>Name:</b> {u.full_name}")
 
 async def migrate_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     uid = update.effective_user.id
-    if not is_admin(uid):
+    if not await is_admin(uid):
         return await update.message.reply_text("Admins only.")
     try:
-        migrate_schema()
-        await update.message.reply_text("Migration complete ✅\nNow send /start and then /whoami.")
+        applied = await adb.migrate_schema()
+        done = "\n".join(applied) if applied else "Schema already up to date."
+        await update.message.reply_text(f"Migration complete ✅\n{done}\nNow send /start and then /whoami.")
     except Exception as e:
         await update.message.reply_text(f"Migration failed: {e}")
 
 def make_app() -> Application:
     if not TOKEN:
         raise RuntimeError("TELEGRAM_BOT_TOKEN not set")
-    app = Application.builder().token(TOKEN).build()
+    async def on_startup(app):
+        if AUTO_MIGRATE and os.getenv("DATABASE_URL"):
+            applied = await adb.migrate_schema()
+            if applied:
+                log.info(f"Applied migrations: {', '.join(applied)}")
+    async def on_shutdown(app):
+        graph_cache.close()
+        user_cache_sync.close()
+        adb.shutdown()
+        audit_writer.close()
+        close_pool()
+    app = Application.builder().token(TOKEN).post_init(on_startup).post_shutdown(on_shutdown).build()
 
     app.add_handler(CommandHandler("start", start))
     app.add_handler(CommandHandler("summary", summary))
@@ -206,6 +271,8 @@ def make_app() -> Application:
 
     app.add_handler(CommandHandler("approve_withdraw", approve_withdraw))
     app.add_handler(CommandHandler("deny_withdraw", deny_withdraw))
+    app.add_handler(CommandHandler("approve_batch", approve_batch))
+    app.add_handler(CommandHandler("deny_batch", deny_batch))
     app.add_handler(CommandHandler("balance", balance_cmd))
     app.add_handler(CommandHandler("set_role", set_role_cmd))
     app.add_handler(CommandHandler("migrate", migrate_cmd))
@@ -242,7 +309,7 @@ if __name__ == "__main__":
 
 async def withdraw_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     u = update.effective_user
-    row = ensure_user(u.id, u.username, u.full_name)
+    row = await adb.ensure_user(u.id, u.username, u.full_name)
     # Expected usage: /withdraw <amount> <address> [network]
     if not context.args or len(context.args) < 2:
         return await update.message.reply_text("Usage: /withdraw <amount> <address> [network]", disable_web_page_preview=True)
@@ -255,14 +322,11 @@ async def withdraw_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     address = context.args[1]
     network = context.args[2] if len(context.args) >= 3 else "TRC20"
 
-    # Check balance
-    if float(row["balance"]) < amount:
-        return await update.message.reply_text(f"Insufficient balance. You have {row['balance']}.")
-
-    # Debit balance and create withdrawal
-    before = row.copy()
-    updated = adjust_user_balance(row['id'], 'sub', amount)
-    wd = create_withdrawal(row['id'], amount, address, network)
-    log_action(f"tg:{u.id}", "withdraw_request", "withdrawal", str(wd['id']), {"before_balance": before, "after_balance": updated, "withdrawal": wd})
+    # Conditional debit + withdrawal + audit entry in one transaction
+    res = await adb.request_withdrawal(row['id'], amount, address, network, actor=f"tg:{u.id}")
+    if not res or not res["withdrawal"]:
+        balance = res["balance"] if res else row["balance"]
+        return await update.message.reply_text(f"Insufficient balance. You have {balance}.")
+    wd = res["withdrawal"]
     await update.message.reply_html(f"✅ Withdrawal request submitted.\nID: <b>{wd['id']}</b> • Amount: <b>{amount}</b> • Network: <b>{network}</b>")
 
@@ -0,0 +1,151 @@
+"""Bulk balance adjustments from CSV.
+
+The CSV needs a header naming its columns: `mode`, `amount` and one or both of
+`tg_id` / `user_id` (each row fills exactly one of them). `mode` is set, add or
+sub, as for /balance. Rows are COPYed into a temp table, checked as a whole,
+then applied with one UPDATE and one multi-row audit insert in a single
+transaction: either every row is applied or none is.
+
+    python -m bot.bulk_balance payouts.csv --actor ops [--dry-run]
+
+The web API exposes the same thing as POST /admin/balances/bulk (text/csv body).
+"""
+import re
+import sys
+import csv
+import argparse
+
+import psycopg2
+
+from .db import db_cursor
+from .cache import user_cache
+
+COLUMNS = ("tg_id", "user_id", "mode", "amount")
+MAX_REPORTED_ERRORS = 20
+
+class BulkBalanceError(ValueError):
+    """The CSV was rejected; `errors` lists (line, message) for the offending rows."""
+
+    def __init__(self, message: str, errors: list = ()):
+        super().__init__(message)
+        self.errors = list(errors)
+
+_STAGE = """
+CREATE TEMP TABLE balance_import (
+  line BIGINT GENERATED ALWAYS AS IDENTITY,
+  tg_id BIGINT,
+  user_id BIGINT,
+  mode TEXT,
+  amount NUMERIC(18,6)
+) ON COMMIT DROP
+"""
+
+# Problems across the whole file, in line order. Line numbers count the header as line 1.
+_CHECK = """
+SELECT line + 1 AS line, problem FROM (
+  SELECT line, CASE
+      WHEN (tg_id IS NULL) = (user_id IS NULL) THEN 'give exactly one of tg_id / user_id'
+      WHEN mode IS NULL OR mode NOT IN ('set','add','sub') THEN 'mode must be set|add|sub'
+      WHEN amount IS NULL OR amount < 0 THEN 'amount must be a non-negative number'
+      WHEN resolved IS NULL THEN 'unknown user'
+      WHEN count(*) OVER (PARTITION BY resolved) > 1 THEN 'user appears more than once'
+    END AS problem
+  FROM balance_import
+) p
+WHERE problem IS NOT NULL
+ORDER BY line
+LIMIT %s
+"""
+
+_APPLY = """
+WITH upd AS (
+  UPDATE users u
+  SET balance = CASE s.mode WHEN 'set' THEN s.amount
+                            WHEN 'add' THEN u.balance + s.amount
+                            ELSE u.balance - s.amount END
+  FROM balance_import s
+  WHERE u.id = s.resolved
+  RETURNING u.id, u.tg_user_id, u.balance, s.mode, s.amount
+), prev AS (
+  SELECT id, balance FROM users WHERE id IN (SELECT resolved FROM balance_import)
+), audit AS (
+  INSERT INTO audit_logs (actor, action, entity_type, entity_id, meta)
+  SELECT %s, 'balance_' || upd.mode, 'user', upd.id::text,
+         jsonb_build_object('before', jsonb_build_object('balance', prev.balance),
+                            'after', jsonb_build_object('balance', upd.balance),
+                            'amount', upd.amount, 'bulk', true)
+  FROM upd JOIN prev ON prev.id = upd.id
+)
+SELECT upd.tg_user_id, upd.balance - prev.balance AS delta
+FROM upd JOIN prev ON prev.id = upd.id
+"""
+
+def _header(stream) -> list:
+    first = stream.readline()
+    cols = [c.strip().lower() for c in next(csv.reader([first]), [])]
+    unknown = [c for c in cols if c not in COLUMNS]
+    if unknown or len(set(cols)) != len(cols):
+        raise BulkBalanceError(f"CSV header must use the columns {', '.join(COLUMNS)}; got {first.strip()!r}")
+    if "mode" not in cols or "amount" not in cols or not ({"tg_id", "user_id"} & set(cols)):
+        raise BulkBalanceError("CSV header needs mode, amount and tg_id and/or user_id")
+    return cols
+
+def apply_balance_csv(stream, actor: str, dry_run: bool = False) -> dict:
+    """Apply every row of a balance CSV (text stream) atomically.
+
+    Returns {"rows", "total_delta", "applied"}; raises BulkBalanceError listing the
+    bad lines if any row is invalid. With dry_run the changes are rolled back.
+    """
+    cols = _header(stream)
+    with db_cursor() as cur:
+        cur.execute(_STAGE)
+        try:
+            cur.copy_expert(f"COPY balance_import ({', '.join(cols)}) FROM STDIN WITH (FORMAT csv)", stream)
+        except (psycopg2.DataError, psycopg2.IntegrityError) as e:
+            # COPY counts from the first data row; report file lines like _CHECK does.
+            where = re.search(r"line (\d+)(.*)", e.diag.context or "")
+            at = f" on line {int(where.group(1)) + 1}{where.group(2)}" if where else ""
+            raise BulkBalanceError(f"Malformed CSV{at}: {e.diag.message_primary}")
+        cur.execute("""ALTER TABLE balance_import ADD COLUMN resolved BIGINT;
+                       UPDATE balance_import s SET resolved = u.id FROM users u WHERE u.id = s.user_id;
+                       UPDATE balance_import s SET resolved = u.id FROM users u
+                        WHERE s.resolved IS NULL AND s.user_id IS NULL AND u.tg_user_id = s.tg_id;
+                       ANALYZE balance_import""")
+        cur.execute(_CHECK, (MAX_REPORTED_ERRORS,))
+        errors = [(r["line"], r["problem"]) for r in cur.fetchall()]
+        if errors:
+            raise BulkBalanceError(f"CSV rejected: {len(errors)}{'+' if len(errors) == MAX_REPORTED_ERRORS else ''} bad rows", errors)
+        # Lock the targets in id order first, so the audit "before" values read by
+        # the next statement are the ones the UPDATE changes (and batches can't deadlock).
+        cur.execute("SELECT id FROM users WHERE id IN (SELECT resolved FROM balance_import) ORDER BY id FOR UPDATE")
+        cur.execute(_APPLY, (actor,))
+        changed = cur.fetchall()
+        if dry_run:
+            cur.connection.rollback()
+    if not dry_run:
+        for r in changed:
+            user_cache.invalidate(r["tg_user_id"])
+    return {"rows": len(changed), "total_delta": str(sum(r["delta"] for r in changed)), "applied": not dry_run}
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog="python -m bot.bulk_balance", description="Apply a CSV of balance changes in one transaction.")
+    ap.add_argument("csv", help="CSV file with header: tg_id and/or user_id, mode, amount ('-' for stdin)")
+    ap.add_argument("--actor", default="cli", help="name recorded in the audit log")
+    ap.add_argument("--dry-run", action="store_true", help="validate and report, then roll back")
+    args = ap.parse_args(argv)
+    stream = sys.stdin if args.csv == "-" else open(args.csv, "r", encoding="utf-8-sig", newline="")
+    try:
+        result = apply_balance_csv(stream, args.actor, dry_run=args.dry_run)
+    except BulkBalanceError as e:
+        print(e, file=sys.stderr)
+        for line, problem in e.errors:
+            print(f"  line {line}: {problem}", file=sys.stderr)
+        return 1
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+    print(f"{'would apply' if args.dry_run else 'applied'} {result['rows']} rows, net change {result['total_delta']}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,118 @@
+import os
+import json
+import time
+import threading
+from collections import OrderedDict
+
+from .notify import NotifyListener
+
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "30"))  # seconds
+
+class TTLCache:
+    """Bounded LRU cache whose entries also expire after `ttl` seconds."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self._epoch = 0  # bumped by every invalidation, see set()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or item[0] < time.monotonic():
+                if item is not None:
+                    del self._data[key]
+                self._stats["misses"] += 1
+                return None
+            self._data.move_to_end(key)
+            self._stats["hits"] += 1
+            return item[1]
+
+    def epoch(self) -> int:
+        return self._epoch
+
+    def set(self, key, value, epoch: int = None):
+        """Store `value`; with `epoch` (read before loading it) only if nothing was invalidated since."""
+        if self.maxsize <= 0 or self.ttl <= 0:
+            return
+        with self._lock:
+            if epoch is not None and epoch != self._epoch:
+                return
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def invalidate(self, key):
+        with self._lock:
+            self._epoch += 1
+            if self._data.pop(key, None) is not None:
+                self._stats["invalidations"] += 1
+
+    def invalidate_where(self, pred):
+        """Drop every entry whose value satisfies `pred`."""
+        with self._lock:
+            self._epoch += 1
+            for key in [k for k, (_, v) in self._data.items() if pred(v)]:
+                del self._data[key]
+                self._stats["invalidations"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._epoch += 1
+            self._data.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            out = dict(self._stats)
+            out["size"] = len(self._data)
+            lookups = out["hits"] + out["misses"]
+            out["hit_rate"] = round(out["hits"] / lookups, 3) if lookups else 0.0
+        return out
+
+class UserCacheSync(NotifyListener):
+    """Drops cached user rows changed by any process, from the users NOTIFY of migrations/0007.
+
+    Entries are keyed by Telegram id while notifications carry users.id, so
+    matching rows are found by value; statements touching more than 200 users
+    (no ids in the payload) clear the whole cache, as does a reconnect. Callers
+    should only serve from the cache while connected().
+    """
+    thread_name = "user-cache-sync"
+
+    def __init__(self, cache: TTLCache, dsn: str = None):
+        super().__init__(dsn)
+        self.cache = cache
+
+    def _on_connect(self, first: bool):
+        # LISTEN is active now: anything cached before it may have missed a change.
+        self.cache.clear()
+
+    def _on_disconnect(self):
+        self.cache.clear()
+
+    def _handle(self, notifies: list):
+        ids = set()
+        for n in notifies:
+            msg = json.loads(n.payload)
+            if msg.get("table") != "users":
+                continue
+            if msg.get("ids") is None:
+                self.cache.clear()
+                return
+            ids.update(msg["ids"])
+        if ids:
+            self.cache.invalidate_where(lambda row: row.get("id") in ids)
+
+# User rows (id, tg_user_id, username, full_name, role, balance) keyed by Telegram id.
+# Each process has its own copy, kept current across processes by user_cache_sync:
+# a change committed elsewhere is dropped here as soon as its notification arrives
+# (normally milliseconds), and nothing is served from the cache while the listener
+# is disconnected. USER_CACHE_TTL remains as a backstop. Role checks do not use it.
+user_cache = TTLCache(USER_CACHE_SIZE, USER_CACHE_TTL)
+user_cache_sync = UserCacheSync(user_cache)
@@ -1,40 +1,170 @@
 import os
-import psycopg2
-import psycopg2.extras
-from contextlib import contextmanager
+import json
+from datetime import datetime
+from contextlib import contextmanager, ExitStack
 
-DATABASE_URL = os.getenv("DATABASE_URL")
+import psycopg2
 
-def get_conn():
-    if not DATABASE_URL:
-        raise RuntimeError("DATABASE_URL is not set")
-    return psycopg2.connect(DATABASE_URL, cursor_factory=psycopg2.extras.RealDictCursor)
+from .pool import get_pool, get_read_router, PoolTimeout
+from .migrate import migrate, applied_version
+from .cache import user_cache, user_cache_sync
+from .audit import audit_writer
 
 @contextmanager
 def db_cursor():
-    conn = get_conn()
-    try:
+    # Pooled connection: committed on success, rolled back on error, then returned.
+    with get_pool().connection() as conn:
         with conn.cursor() as cur:
             yield cur
-            conn.commit()
-    except Exception:
-        conn.rollback()
-        raise
-    finally:
-        conn.close()
+
+@contextmanager
+def read_connection():
+    """Connection for read-only queries that can tolerate replica lag.
+
+    Served by DATABASE_REPLICA_URL when it is configured, reachable and within
+    REPLICA_MAX_LAG_SECONDS, else by the primary. Writes, and reads that must see
+    a write just made (the pending queue, a user's own dashboard, event rows),
+    stay on db_cursor().
+    """
+    router = get_read_router()
+    pool = router.pool()
+    with ExitStack() as stack:
+        try:
+            conn = stack.enter_context(pool.connection())
+        except (psycopg2.OperationalError, PoolTimeout):
+            if pool is get_pool():
+                raise
+            router.mark_failed()
+            pool = get_pool()
+            conn = stack.enter_context(pool.connection())
+        try:
+            yield conn
+        except psycopg2.OperationalError:
+            if pool is not get_pool():
+                router.mark_failed()
+            raise
+
+@contextmanager
+def read_cursor():
+    with read_connection() as conn:
+        with conn.cursor() as cur:
+            yield cur
+
+_USER_COLS = "id, tg_user_id, username, full_name, role, balance"
+_schema_caps = None
+
+def schema_caps(cur) -> dict:
+    """Optional/legacy columns present on this database, probed once per process."""
+    global _schema_caps
+    if _schema_caps is None:
+        cur.execute("SELECT column_name FROM information_schema.columns WHERE table_name='users'")
+        cols = {r["column_name"] for r in cur.fetchall()}
+        _schema_caps = {"users_tg_id": "tg_id" in cols}
+    return _schema_caps
+
+def _forget_user(row):
+    # Drop the cached copy of a user row that was just written.
+    if row and row.get("tg_user_id") is not None:
+        user_cache.invalidate(row["tg_user_id"])
+    return row
+
+def _audit(cur, actor: str, action: str, entity_type: str, entity_id, meta: dict):
+    # Audit row in the caller's transaction: it commits, or rolls back, with the change it records.
+    cur.execute("INSERT INTO audit_logs (actor, action, entity_type, entity_id, meta) VALUES (%s,%s,%s,%s,%s::jsonb)",
+                (actor, action, entity_type, str(entity_id), json.dumps(meta, default=str)))
+
+def _cached_user(tg_user_id: int):
+    # Only trusted while this process hears about user changes made by others.
+    user_cache_sync.start()
+    return user_cache.get(tg_user_id) if user_cache_sync.connected() else None
 
 def ensure_user(tg_user_id: int, username: str = None, full_name: str = None):
+    """Fetch or create the user in a single upsert round trip (cached per process)."""
+    cached = _cached_user(tg_user_id)
+    if cached and (username is None or username == cached["username"]) \
+            and (full_name is None or full_name == cached["full_name"]):
+        return dict(cached)
+    epoch = user_cache.epoch()
     with db_cursor() as cur:
-        cur.execute("SELECT id, tg_user_id, username, full_name, role, balance FROM users WHERE tg_user_id=%s", (tg_user_id,))
-        row = cur.fetchone()
-        if row:
-            return row
+        cols = ["tg_user_id", "username", "full_name"]
+        vals = [tg_user_id, username, full_name]
+        if schema_caps(cur)["users_tg_id"]:
+            # legacy 'tg_id' may be NOT NULL: fill it with the same value
+            cols.insert(1, "tg_id")
+            vals.insert(1, tg_user_id)
         cur.execute(
-            "INSERT INTO users (tg_user_id, username, full_name) VALUES (%s,%s,%s) RETURNING id, tg_user_id, username, full_name, role, balance",
-            (tg_user_id, username, full_name)
+            f"""INSERT INTO users ({",".join(cols)}) VALUES ({",".join(["%s"] * len(vals))})
+                ON CONFLICT (tg_user_id) DO UPDATE
+                  SET username = COALESCE(EXCLUDED.username, users.username),
+                      full_name = COALESCE(EXCLUDED.full_name, users.full_name)
+                RETURNING {_USER_COLS}""",
+            tuple(vals),
         )
+        row = cur.fetchone()
+    user_cache.set(tg_user_id, dict(row), epoch)
+    return row
+
+def get_user_by_tg(tg_user_id: int):
+    """Cached lookup that does not create the user; None when unknown."""
+    cached = _cached_user(tg_user_id)
+    if cached:
+        return dict(cached)
+    epoch = user_cache.epoch()
+    with db_cursor() as cur:
+        cur.execute(f"SELECT {_USER_COLS} FROM users WHERE tg_user_id=%s", (tg_user_id,))
+        row = cur.fetchone()
+    if row:
+        user_cache.set(tg_user_id, dict(row), epoch)
+    return row
+
+def get_user_role(tg_user_id: int):
+    """Current role from the primary, never cached: used for permission checks."""
+    with db_cursor() as cur:
+        cur.execute("SELECT role FROM users WHERE tg_user_id=%s", (tg_user_id,))
+        row = cur.fetchone()
+    return row["role"] if row else None
+
+def user_cache_stats() -> dict:
+    out = user_cache.stats()
+    out["synced"] = user_cache_sync.connected()
+    return out
+
+def admin_summary(primary: bool = False) -> dict:
+    """User count, pending withdrawals and balance total from the trigger-maintained admin_counters.
+
+    Read from the replica unless `primary` is set (callers reacting to a change just committed).
+    """
+    with (db_cursor() if primary else read_cursor()) as cur:
+        cur.execute("""SELECT COALESCE(SUM(users),0)::bigint AS users,
+                              COALESCE(SUM(pending_withdrawals),0)::bigint AS pending_withdrawals,
+                              COALESCE(SUM(total_balance),0) AS total_balances
+                       FROM admin_counters""")
         return cur.fetchone()
 
+def table_versions() -> dict:
+    """Change counters for users / withdrawals / audit_logs (see migrations/0008); for ETags.
+
+    Takes no arguments. The returned row also has a `primary` column: True when the
+    primary answered (replica missing or behind). Pass that value as the listing's
+    `primary=` argument so the rows are never older than the version they are tagged with.
+    """
+    with read_cursor() as cur:
+        cur.execute("""SELECT COALESCE(SUM(users_version),0)::bigint AS users,
+                              COALESCE(SUM(withdrawals_version),0)::bigint AS withdrawals,
+                              COALESCE(SUM(logs_version),0)::bigint AS logs,
+                              NOT pg_is_in_recovery() AS primary
+                       FROM admin_counters""")
+        return cur.fetchone()
+
+def user_version(tg_user_id: int):
+    """Change counter of one user's row and withdrawals (see migrations/0009), or None if no such user."""
+    with db_cursor() as cur:
+        cur.execute("""SELECT COALESCE(v.version, 0) AS version
+                       FROM users u LEFT JOIN user_versions v ON v.user_id=u.id
+                       WHERE u.tg_user_id=%s""", (tg_user_id,))
+        row = cur.fetchone()
+    return row["version"] if row else None
+
 def get_pending_withdrawals():
     with db_cursor() as cur:
         cur.execute("""SELECT w.*, u.username, u.tg_user_id
@@ -52,17 +182,139 @@ def update_withdrawal_status(withdrawal_id: int, status: str, actor: str, txid:
                         RETURNING *""", (status, actor, txid, note, withdrawal_id))
         return cur.fetchone()
 
-def adjust_user_balance(user_id: int, mode: str, amount: float):
+def decide_withdrawal(withdrawal_id: int, status: str, actor: str, txid: str = None, note: str = None):
+    """Approve or deny one pending withdrawal; denying it refunds the user.
+
+    The row is locked and must still be pending, so two concurrent decisions
+    cannot both apply (or refund twice); the status change, refund and audit
+    row commit together. Returns (previous row, updated row), with updated None
+    when it had already been decided, or None when the withdrawal does not exist.
+    """
+    if status not in ("approved", "denied"):
+        raise ValueError("status must be approved|denied")
+    refunded = None
+    with db_cursor() as cur:
+        cur.execute("SELECT * FROM withdrawals WHERE id=%s FOR UPDATE", (withdrawal_id,))
+        prev = cur.fetchone()
+        if not prev:
+            return None
+        if prev["status"] != "pending":
+            return prev, None
+        cur.execute("""UPDATE withdrawals
+                        SET status=%s, decided_at=NOW(), decided_by=%s, txid=COALESCE(%s, txid), note=COALESCE(%s, note)
+                        WHERE id=%s
+                        RETURNING *""", (status, actor, txid, note, withdrawal_id))
+        updated = cur.fetchone()
+        if status == "denied":
+            cur.execute("UPDATE users SET balance=balance+%s WHERE id=%s RETURNING *", (prev["amount"], prev["user_id"]))
+            refunded = cur.fetchone()
+        _audit(cur, actor, "withdrawal_approve" if status == "approved" else "withdrawal_deny", "withdrawal", withdrawal_id,
+               {"before": prev, "after": updated, "refunded": refunded is not None})
+    _forget_user(refunded)
+    return prev, updated
+
+def decide_withdrawals(ids: list, status: str, actor: str, note: str = None):
+    """Approve or deny many pending withdrawals in one statement.
+
+    Only rows still pending are decided (locked in id order); denied ones are
+    refunded with one UPDATE per affected user and every decision gets an audit
+    row, all in the same transaction. Returns (decided rows, skipped ids) where
+    skipped ids were missing or already decided.
+    """
+    if status not in ("approved", "denied"):
+        raise ValueError("status must be approved|denied")
+    ids = sorted({int(i) for i in ids})
+    action = "withdrawal_approve" if status == "approved" else "withdrawal_deny"
+    with db_cursor() as cur:
+        cur.execute("""
+            WITH target AS (
+              SELECT id FROM withdrawals WHERE id = ANY(%(ids)s) AND status='pending'
+              ORDER BY id FOR UPDATE
+            ), upd AS (
+              UPDATE withdrawals w
+              SET status=%(status)s, decided_at=NOW(), decided_by=%(actor)s, note=COALESCE(%(note)s, w.note)
+              FROM target WHERE w.id = target.id
+              RETURNING w.*
+            ), refunds AS (
+              SELECT user_id, SUM(amount) AS amount FROM upd WHERE upd.status='denied' GROUP BY user_id
+            ), credited AS (
+              UPDATE users u SET balance = u.balance + r.amount
+              FROM refunds r WHERE u.id = r.user_id
+              RETURNING u.id, u.tg_user_id
+            ), audit AS (
+              INSERT INTO audit_logs (actor, action, entity_type, entity_id, meta)
+              SELECT %(actor)s, %(action)s, 'withdrawal', upd.id::text,
+                     jsonb_build_object('before', jsonb_build_object('status', 'pending'),
+                                        'after', to_jsonb(upd), 'batch', true,
+                                        'refunded', upd.status = 'denied')
+              FROM upd
+            )
+            SELECT upd.*, c.tg_user_id AS refunded_tg_user_id
+            FROM upd LEFT JOIN credited c ON c.id = upd.user_id
+            ORDER BY upd.id""", {"ids": ids, "status": status, "actor": actor, "note": note, "action": action})
+        rows = cur.fetchall()
+    for r in rows:
+        if r["refunded_tg_user_id"] is not None:
+            user_cache.invalidate(r.pop("refunded_tg_user_id"))
+        else:
+            r.pop("refunded_tg_user_id")
+    decided = {r["id"] for r in rows}
+    return rows, [i for i in ids if i not in decided]
+
+def user_withdrawals(tg_user_id: int, limit: int = 200):
+    with db_cursor() as cur:
+        cur.execute("""SELECT w.* FROM withdrawals w JOIN users u ON u.id=w.user_id
+                       WHERE u.tg_user_id=%s
+                       ORDER BY w.requested_at DESC LIMIT %s""", (tg_user_id, limit))
+        return cur.fetchall()
+
+DASHBOARD_FIELDS = ("profile", "balance", "withdrawals")
+
+def dashboard(tg_user_id: int, fields=DASHBOARD_FIELDS, limit: int = 50):
+    """Profile, balance and recent withdrawals for one user in a single statement.
+
+    `fields` picks which parts are fetched; the withdrawals list is aggregated
+    in the same query. Returns None when the user does not exist.
+    """
+    cols = ["u.id", "u.tg_user_id"]
+    if "profile" in fields:
+        cols += ["u.username", "u.full_name", "u.role"]
+    if "balance" in fields:
+        cols.append("u.balance")
+    args = []
+    if "withdrawals" in fields:
+        cols.append("""(SELECT COALESCE(json_agg(w ORDER BY w.requested_at DESC, w.id DESC), '[]')
+                        FROM (SELECT * FROM withdrawals WHERE user_id=u.id
+                              ORDER BY requested_at DESC, id DESC LIMIT %s) w) AS withdrawals""")
+        args.append(limit)
+    with db_cursor() as cur:
+        cur.execute(f"SELECT {', '.join(cols)} FROM users u WHERE u.tg_user_id=%s", (*args, tg_user_id))
+        return cur.fetchone()
+
+def get_user(user_id: int):
+    with db_cursor() as cur:
+        cur.execute("SELECT * FROM users WHERE id=%s", (user_id,))
+        return cur.fetchone()
+
+def adjust_user_balance(user_id: int, mode: str, amount: float, actor: str = None):
+    """Set, add to or subtract from a balance; with `actor`, audited in the same transaction."""
+    if mode not in ("set", "add", "sub"):
+        raise ValueError("mode must be one of set|add|sub")
     with db_cursor() as cur:
+        before = None
+        if actor:
+            cur.execute("SELECT * FROM users WHERE id=%s FOR UPDATE", (user_id,))
+            before = cur.fetchone()
         if mode == 'set':
             cur.execute("UPDATE users SET balance=%s WHERE id=%s RETURNING *", (amount, user_id))
         elif mode == 'add':
             cur.execute("UPDATE users SET balance=balance+%s WHERE id=%s RETURNING *", (amount, user_id))
-        elif mode == 'sub':
-            cur.execute("UPDATE users SET balance=balance-%s WHERE id=%s RETURNING *", (amount, user_id))
         else:
-            raise ValueError("mode must be one of set|add|sub")
-        return cur.fetchone()
+            cur.execute("UPDATE users SET balance=balance-%s WHERE id=%s RETURNING *", (amount, user_id))
+        updated = cur.fetchone()
+        if actor and updated:
+            _audit(cur, actor, f"balance_{mode}", "user", user_id, {"before": before, "after": updated, "amount": amount})
+        return _forget_user(updated)
 
 def find_user(identifier: str):
     with db_cursor() as cur:
@@ -73,230 +325,138 @@ def find_user(identifier: str):
             cur.execute("SELECT * FROM users WHERE username ILIKE %s", (handle,))
         return cur.fetchone()
 
-def set_user_role(user_id: int, role: str):
+def set_user_role(user_id: int, role: str, actor: str = None):
+    """Change a user's role; with `actor`, audited in the same transaction."""
     with db_cursor() as cur:
+        before = None
+        if actor:
+            cur.execute("SELECT * FROM users WHERE id=%s FOR UPDATE", (user_id,))
+            before = cur.fetchone()
         cur.execute("UPDATE users SET role=%s WHERE id=%s RETURNING *", (role, user_id))
-        return cur.fetchone()
+        updated = cur.fetchone()
+        if actor and updated:
+            _audit(cur, actor, "role_set", "user", user_id, {"before": before, "after": updated})
+        return _forget_user(updated)
 
 def log_action(actor: str, action: str, entity_type: str = None, entity_id: str = None, meta: dict = None):
-    with db_cursor() as cur:
-        cur.execute("""INSERT INTO audit_logs (actor, action, entity_type, entity_id, meta)
-                        VALUES (%s,%s,%s,%s,%s) RETURNING *""", (actor, action, entity_type, entity_id, psycopg2.extras.Json(meta or {})))
-        return cur.fetchone()
+    """Queue an audit entry; bot/audit.py writes it in the next batch.
 
-def get_audit_logs(limit: int = 200):
-    with db_cursor() as cur:
-        cur.execute("SELECT * FROM audit_logs ORDER BY created_at DESC LIMIT %s", (limit,))
+    Best effort for entries not tied to a write: balance, role and withdrawal
+    changes record their own audit row in the same transaction instead.
+    """
+    audit_writer.submit(actor, action, entity_type, entity_id, meta)
+
+def flush_audit():
+    audit_writer.flush()
+
+def audit_stats() -> dict:
+    return audit_writer.stats()
+
+def parse_cursor(after: str):
+    """Split an "<iso timestamp>,<id>" keyset cursor; raises ValueError if malformed."""
+    ts, _, pk = (after or "").rpartition(",")
+    if not ts or not pk.isdigit():
+        raise ValueError(f"Invalid cursor: {after!r}")
+    try:
+        ts = datetime.fromisoformat(ts)
+    except ValueError:
+        raise ValueError(f"Invalid cursor: {after!r}") from None
+    return ts, int(pk)
+
+def next_cursor(rows: list, ts_col: str, limit: int):
+    """Cursor for the page after `rows`, or None when this was the last page."""
+    if not rows or len(rows) < limit:
+        return None
+    last = rows[-1]
+    return f"{last[ts_col].isoformat()},{last['id']}"
+
+def _keyset(where: list, args: list, after: str, ts_col: str, id_col: str = "id"):
+    if after:
+        ts, pk = parse_cursor(after)
+        where.append(f"({ts_col}, {id_col}) < (%s::timestamptz, %s)")
+        args.extend([ts, pk])
+
+def get_audit_logs(limit: int = 200, after: str = None, primary: bool = False):
+    where, args = [], []
+    _keyset(where, args, after, "created_at")
+    with (db_cursor() if primary else read_cursor()) as cur:
+        cur.execute(f"""SELECT * FROM audit_logs {"WHERE " + " AND ".join(where) if where else ""}
+                        ORDER BY created_at DESC, id DESC LIMIT %s""", (*args, limit))
         return cur.fetchall()
 
-def list_users(limit: int = 200):
-    with db_cursor() as cur:
-        cur.execute("SELECT * FROM users ORDER BY created_at DESC LIMIT %s", (limit,))
+def list_users(limit: int = 200, after: str = None, primary: bool = False):
+    where, args = [], []
+    _keyset(where, args, after, "created_at")
+    with (db_cursor() if primary else read_cursor()) as cur:
+        cur.execute(f"""SELECT * FROM users {"WHERE " + " AND ".join(where) if where else ""}
+                        ORDER BY created_at DESC, id DESC LIMIT %s""", (*args, limit))
         return cur.fetchall()
 
-def list_withdrawals(status: str = None, limit: int = 200):
-    with db_cursor() as cur:
-        if status:
-            cur.execute("""SELECT w.*, u.username, u.tg_user_id
-                           FROM withdrawals w JOIN users u ON u.id=w.user_id
-                           WHERE w.status=%s ORDER BY requested_at DESC LIMIT %s""", (status, limit))
-        else:
-            cur.execute("""SELECT w.*, u.username, u.tg_user_id
-                           FROM withdrawals w JOIN users u ON u.id=w.user_id
-                           ORDER BY requested_at DESC LIMIT %s""", (limit,))
+def list_withdrawals(status: str = None, limit: int = 200, after: str = None, primary: bool = False):
+    where, args = [], []
+    if status:
+        where.append("w.status=%s")
+        args.append(status)
+    _keyset(where, args, after, "w.requested_at", "w.id")
+    with (db_cursor() if primary else read_cursor()) as cur:
+        cur.execute(f"""SELECT w.*, u.username, u.tg_user_id
+                        FROM withdrawals w JOIN users u ON u.id=w.user_id
+                        {"WHERE " + " AND ".join(where) if where else ""}
+                        ORDER BY w.requested_at DESC, w.id DESC LIMIT %s""", (*args, limit))
         return cur.fetchall()
 
-def migrate_schema():
-    sql = """
-
-
-DO $$
-BEGIN
-  -- Ensure users table exists
-  IF NOT EXISTS (
-    SELECT 1 FROM information_schema.tables WHERE table_name='users'
-  ) THEN
-    CREATE TABLE users (
-      id BIGSERIAL PRIMARY KEY,
-      tg_user_id BIGINT UNIQUE,
-      username TEXT,
-      full_name TEXT,
-      role TEXT NOT NULL DEFAULT 'user' CHECK (role IN ('admin','manager','support','user')),
-      balance NUMERIC(18,6) NOT NULL DEFAULT 0,
-      created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
-    );
-  END IF;
-
-  -- Columns
-  IF NOT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name='users' AND column_name='tg_user_id') THEN
-    ALTER TABLE users ADD COLUMN tg_user_id BIGINT;
-  END IF;
-  IF NOT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name='users' AND column_name='username') THEN
-    ALTER TABLE users ADD COLUMN username TEXT;
-  END IF;
-  IF NOT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name='users' AND column_name='full_name') THEN
-    ALTER TABLE users ADD COLUMN full_name TEXT;
-  END IF;
-  IF NOT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name='users' AND column_name='role') THEN
-    ALTER TABLE users ADD COLUMN role TEXT NOT NULL DEFAULT 'user';
-  END IF;
-  IF NOT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name='users' AND column_name='balance') THEN
-    ALTER TABLE users ADD COLUMN balance NUMERIC(18,6) NOT NULL DEFAULT 0;
-  END IF;
-  IF NOT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name='users' AND column_name='created_at') THEN
-    ALTER TABLE users ADD COLUMN created_at TIMESTAMPTZ NOT NULL DEFAULT NOW();
-  END IF;
-
-  -- Unique constraint on tg_user_id (only if missing)
-  IF NOT EXISTS (
-    SELECT 1 FROM pg_constraint WHERE conname = 'users_tg_user_id_key'
-  ) THEN
-    ALTER TABLE users ADD CONSTRAINT users_tg_user_id_key UNIQUE (tg_user_id);
-  END IF;
-END $$;
-
--- Withdrawals
-CREATE TABLE IF NOT EXISTS withdrawals (
-  id BIGSERIAL PRIMARY KEY,
-  user_id BIGINT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
-  amount NUMERIC(18,6) NOT NULL CHECK (amount > 0),
-  address TEXT NOT NULL,
-  network TEXT NOT NULL DEFAULT 'TRC20',
-  status TEXT NOT NULL DEFAULT 'pending' CHECK (status IN ('pending','approved','denied')),
-  requested_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
-  decided_at TIMESTAMPTZ,
-  decided_by TEXT,
-  txid TEXT,
-  note TEXT
-);
-CREATE INDEX IF NOT EXISTS withdrawals_status_idx ON withdrawals(status);
-
--- Audit logs
-/*BACKFILL_TG_ID*/
--- Backfill legacy tg_id if the column exists
-DO $$ BEGIN
-IF EXISTS (
-  SELECT 1 FROM information_schema.columns WHERE table_name='users' AND column_name='tg_id'
-) THEN
-  UPDATE users SET tg_id = COALESCE(tg_id, tg_user_id);
-END IF; END $$;
-
-CREATE TABLE IF NOT EXISTS audit_logs (
-  id BIGSERIAL PRIMARY KEY,
-  actor TEXT,
-  action TEXT NOT NULL,
-  entity_type TEXT,
-  entity_id TEXT,
-  meta JSONB,
-  created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
-);
-"""
+DELTA_SETTLE_SECONDS = float(os.getenv("DELTA_SETTLE_SECONDS", "5"))
+
+# name -> (select, change timestamp column, id column)
+_DELTA_SOURCES = {
+    "users": ("SELECT * FROM users", "updated_at", "id"),
+    "withdrawals": ("""SELECT w.*, u.username, u.tg_user_id
+                       FROM withdrawals w JOIN users u ON u.id=w.user_id""", "w.updated_at", "w.id"),
+    "logs": ("SELECT * FROM audit_logs", "created_at", "id"),
+}
+
+def list_changes(source: str, since: str = None, limit: int = 1000):
+    """Rows created or changed after the `since` cursor, oldest first.
+
+    Returns (rows, next_cursor). Rows younger than DELTA_SETTLE_SECONDS are held
+    back so a transaction that commits slightly later than its timestamp is not
+    skipped; pass next_cursor as `since` on the following call.
+    """
+    select, ts_col, id_col = _DELTA_SOURCES[source]
+    where = [f"{ts_col} < NOW() - make_interval(secs => %s)"]
+    args = [DELTA_SETTLE_SECONDS]
+    if since:
+        ts, pk = parse_cursor(since)
+        where.append(f"({ts_col}, {id_col}) > (%s::timestamptz, %s)")
+        args.extend([ts, pk])
     with db_cursor() as cur:
-        cur.execute(sql)
-    return True
-
-import psycopg2.errors
-
-def ensure_users_schema():
-    """Ensure required columns/constraints exist (idempotent)."""
-    migrate_schema()
-
-def _safe_select_user_by_tg(cur, tg_user_id):
-    try:
-        cur.execute("SELECT id, tg_user_id, username, full_name, role, balance FROM users WHERE tg_user_id=%s", (tg_user_id,))
-        return cur.fetchone()
-    except psycopg2.errors.UndefinedColumn:
-        # Heal schema and retry once
-        cur.connection.rollback()
-        migrate_schema()
-        cur.execute("SELECT id, tg_user_id, username, full_name, role, balance FROM users WHERE tg_user_id=%s", (tg_user_id,))
-        return cur.fetchone()
-
-def ensure_user(tg_user_id: int, username: str = None, full_name: str = None):
+        cur.execute(f"""{select} WHERE {" AND ".join(where)}
+                        ORDER BY {ts_col}, {id_col} LIMIT %s""", (*args, limit))
+        rows = cur.fetchall()
+    if not rows:
+        return rows, since
+    ts_key = ts_col.split(".")[-1]
+    return rows, f"{rows[-1][ts_key].isoformat()},{rows[-1]['id']}"
+
+def rows_by_id(source: str, ids: list):
+    """Current users/withdrawals rows for `ids`, shaped like the listing endpoints."""
+    select, _, id_col = _DELTA_SOURCES[source]
     with db_cursor() as cur:
-        row = _safe_select_user_by_tg(cur, tg_user_id)
-        if row:
-            return row
-        try:
-            cur.execute(
-                "INSERT INTO users (tg_user_id, username, full_name) VALUES (%s,%s,%s) RETURNING id, tg_user_id, username, full_name, role, balance",
-                (tg_user_id, username, full_name)
-            )
-            return cur.fetchone()
-        except psycopg2.errors.UndefinedColumn:
-            cur.connection.rollback()
-            migrate_schema()
-            cur.execute(
-                "INSERT INTO users (tg_user_id, username, full_name) VALUES (%s,%s,%s) RETURNING id, tg_user_id, username, full_name, role, balance",
-                (tg_user_id, username, full_name)
-            )
-            return cur.fetchone()
+        cur.execute(f"{select} WHERE {id_col} = ANY(%s)", (list(ids),))
+        return cur.fetchall()
 
-def find_user(identifier: str):
+def schema_version() -> int:
+    """Applied schema version, read over the pool (cheap enough for readiness probes)."""
     with db_cursor() as cur:
-        try:
-            if identifier.isdigit():
-                cur.execute("SELECT * FROM users WHERE tg_user_id=%s", (int(identifier),))
-            else:
-                handle = identifier.lstrip('@')
-                cur.execute("SELECT * FROM users WHERE username ILIKE %s", (handle,))
-            return cur.fetchone()
-        except psycopg2.errors.UndefinedColumn:
-            cur.connection.rollback()
-            migrate_schema()
-            if identifier.isdigit():
-                cur.execute("SELECT * FROM users WHERE tg_user_id=%s", (int(identifier),))
-            else:
-                handle = identifier.lstrip('@')
-                cur.execute("SELECT * FROM users WHERE username ILIKE %s", (handle,))
-            return cur.fetchone()
-
-def _has_column(cur, table: str, column: str) -> bool:
-    cur.execute(
-        "SELECT 1 FROM information_schema.columns WHERE table_name=%s AND column_name=%s",
-        (table, column),
-    )
-    return cur.fetchone() is not None
+        return applied_version(cur)
 
-def ensure_user(tg_user_id: int, username: str = None, full_name: str = None):
-    with db_cursor() as cur:
-        row = _safe_select_user_by_tg(cur, tg_user_id)
-        if row:
-            return row
-        # Determine column set dynamically (support legacy 'tg_id' NOT NULL)
-        cols = ["tg_user_id", "username", "full_name"]
-        vals = [tg_user_id, username, full_name]
-        if _has_column(cur, "users", "tg_id"):
-            # insert both columns with same value to satisfy NOT NULL
-            cols = ["tg_user_id", "tg_id", "username", "full_name"]
-            vals = [tg_user_id, tg_user_id, username, full_name]
-        cols_list = ",".join(cols)
-        placeholders = ",".join(["%s"] * len(vals))
-        try:
-            cur.execute(
-                f"INSERT INTO users ({cols_list}) VALUES ({placeholders}) "
-                "RETURNING id, tg_user_id, username, full_name, role, balance",
-                tuple(vals),
-            )
-            return cur.fetchone()
-        except psycopg2.errors.UndefinedColumn:
-            cur.connection.rollback()
-            migrate_schema()
-            # retry once
-            if _has_column(cur, "users", "tg_id"):
-                cols = ["tg_user_id", "tg_id", "username", "full_name"]
-                vals = [tg_user_id, tg_user_id, username, full_name]
-            else:
-                cols = ["tg_user_id", "username", "full_name"]
-                vals = [tg_user_id, username, full_name]
-            cols_list = ",".join(cols)
-            placeholders = ",".join(["%s"] * len(vals))
-            cur.execute(
-                f"INSERT INTO users ({cols_list}) VALUES ({placeholders}) "
-                "RETURNING id, tg_user_id, username, full_name, role, balance",
-                tuple(vals),
-            )
-            return cur.fetchone()
+def migrate_schema():
+    """Apply pending migrations from migrations/ (see bot/migrate.py)."""
+    global _schema_caps
+    applied = migrate()
+    if applied:
+        _schema_caps = None
+    return applied
 
 
 def _get_user_pk_by_tg(cur, tg_user_id: int):
@@ -327,6 +487,41 @@ def create_withdrawal(user_pk: int, amount: float, address: str, network: str =
         )
         return cur.fetchone()
 
+def request_withdrawal(user_pk: int, amount: float, address: str, network: str = "TRC20", actor: str = None):
+    """Debit the balance, create the withdrawal and audit it in one statement.
+
+    The debit only matches while balance >= amount, so concurrent requests cannot
+    overdraw. Returns {"balance", "withdrawal", "tg_user_id"} where "withdrawal" is
+    None when funds were insufficient, or None if the user does not exist.
+    """
+    with db_cursor() as cur:
+        cur.execute("""
+            WITH debit AS (
+              UPDATE users SET balance = balance - %(amount)s::numeric
+              WHERE id = %(uid)s AND balance >= %(amount)s::numeric
+              RETURNING id, balance
+            ), wd AS (
+              INSERT INTO withdrawals (user_id, amount, address, network)
+              SELECT id, %(amount)s::numeric, %(address)s, %(network)s FROM debit
+              RETURNING *
+            ), audit AS (
+              INSERT INTO audit_logs (actor, action, entity_type, entity_id, meta)
+              SELECT %(actor)s, 'withdraw_request', 'withdrawal', wd.id::text,
+                     jsonb_build_object('before_balance', debit.balance + wd.amount,
+                                        'after_balance', debit.balance, 'withdrawal', to_jsonb(wd))
+              FROM wd JOIN debit ON debit.id = wd.user_id
+            )
+            SELECT COALESCE(debit.balance, u.balance) AS balance, to_jsonb(wd) AS withdrawal, u.tg_user_id
+            FROM users u
+            LEFT JOIN debit ON debit.id = u.id
+            LEFT JOIN wd ON wd.user_id = u.id
+            WHERE u.id = %(uid)s""",
+            {"uid": user_pk, "amount": amount, "address": address, "network": network, "actor": actor})
+        row = cur.fetchone()
+    if row and row["withdrawal"]:
+        _forget_user(row)
+    return row
+
 def get_withdrawal(withdrawal_id: int):
     with db_cursor() as cur:
         cur.execute("SELECT * FROM withdrawals WHERE id=%s", (withdrawal_id,))
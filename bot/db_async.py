@@ -0,0 +1,95 @@
+"""Awaitable versions of the bot/db.py helpers.
+
+psycopg2 is blocking, so each call runs on a small thread pool sized to the
+connection pool (DB_POOL_MAX). Handlers await these instead of calling bot/db.py
+directly, which keeps one slow query from stalling the event loop (PTB in the
+bot, uvicorn in the web API). start()/shutdown() bracket the executor's life;
+calls made before start() create it on demand.
+"""
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from . import db
+from .pool import DB_POOL_MAX
+
+_executor = None
+_lock = threading.Lock()
+_stats = {"calls": 0, "queued": 0, "running": 0, "peak_running": 0, "peak_queued": 0, "errors": 0}
+
+def start(workers: int = DB_POOL_MAX) -> ThreadPoolExecutor:
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="db")
+        return _executor
+
+def _tracked(fn):
+    with _lock:
+        _stats["queued"] -= 1
+        _stats["running"] += 1
+        _stats["peak_running"] = max(_stats["peak_running"], _stats["running"])
+    try:
+        return fn()
+    except Exception:
+        with _lock:
+            _stats["errors"] += 1
+        raise
+    finally:
+        with _lock:
+            _stats["running"] -= 1
+
+async def run_db(fn, *args, **kwargs):
+    executor = _executor or start()
+    with _lock:
+        _stats["calls"] += 1
+        _stats["queued"] += 1
+        _stats["peak_queued"] = max(_stats["peak_queued"], _stats["queued"])
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, _tracked, functools.partial(fn, *args, **kwargs))
+
+def executor_stats() -> dict:
+    with _lock:
+        out = dict(_stats)
+        out["workers"] = _executor._max_workers if _executor is not None else 0
+    return out
+
+def _offload(fn):
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        return await run_db(fn, *args, **kwargs)
+    return wrapper
+
+ensure_user = _offload(db.ensure_user)
+get_user = _offload(db.get_user)
+get_user_by_tg = _offload(db.get_user_by_tg)
+get_user_role = _offload(db.get_user_role)
+dashboard = _offload(db.dashboard)
+find_user = _offload(db.find_user)
+set_user_role = _offload(db.set_user_role)
+adjust_user_balance = _offload(db.adjust_user_balance)
+update_withdrawal_status = _offload(db.update_withdrawal_status)
+decide_withdrawal = _offload(db.decide_withdrawal)
+decide_withdrawals = _offload(db.decide_withdrawals)
+user_withdrawals = _offload(db.user_withdrawals)
+create_withdrawal = _offload(db.create_withdrawal)
+request_withdrawal = _offload(db.request_withdrawal)
+get_withdrawal = _offload(db.get_withdrawal)
+admin_summary = _offload(db.admin_summary)
+table_versions = _offload(db.table_versions)
+user_version = _offload(db.user_version)
+list_users = _offload(db.list_users)
+list_withdrawals = _offload(db.list_withdrawals)
+get_audit_logs = _offload(db.get_audit_logs)
+list_changes = _offload(db.list_changes)
+log_action = _offload(db.log_action)
+migrate_schema = _offload(db.migrate_schema)
+schema_version = _offload(db.schema_version)
+
+def shutdown():
+    global _executor
+    with _lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=True)
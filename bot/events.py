@@ -0,0 +1,100 @@
+"""Fan-out of admin change events from Postgres LISTEN/NOTIFY.
+
+Triggers on users and withdrawals NOTIFY the admin_events channel with the ids
+of changed rows (migrations/0007). While anyone is subscribed, one listener
+thread per process (bot/notify.py) holds a dedicated connection, coalesces
+notifications for EVENT_COALESCE seconds, loads the changed rows and the
+summary once, and hands the resulting events to every subscriber's asyncio
+queue. Connected clients therefore cost nothing while the data is quiet, and a
+burst of changes costs one query per table however many clients are watching.
+
+Events are (name, data) pairs: ("users", [rows]), ("withdrawals", [rows]),
+("summary", {...}) and ("resync", None) when rows may have been missed (a large
+statement or a listener reconnect) and clients should reload.
+"""
+import os
+import json
+import asyncio
+import logging
+
+from .notify import NotifyListener
+from . import db
+
+log = logging.getLogger("trustmeai.events")
+
+EVENT_COALESCE = float(os.getenv("EVENT_COALESCE", "0.25"))  # seconds to batch notifications
+EVENT_QUEUE_SIZE = int(os.getenv("EVENT_QUEUE_SIZE", "100"))  # per subscriber
+
+class EventHub(NotifyListener):
+    thread_name = "admin-events"
+
+    def __init__(self, dsn: str = None, coalesce: float = EVENT_COALESCE):
+        super().__init__(dsn, coalesce)
+        self._subs = {}  # asyncio.Queue -> loop
+
+    def subscribe(self) -> asyncio.Queue:
+        """Queue of events for the calling event loop; pass it to unsubscribe() when done."""
+        q = asyncio.Queue(maxsize=EVENT_QUEUE_SIZE)
+        with self._lock:
+            self._subs[q] = asyncio.get_running_loop()
+        self.start()
+        return q
+
+    def unsubscribe(self, q: asyncio.Queue):
+        with self._lock:
+            self._subs.pop(q, None)
+
+    def subscribers(self) -> int:
+        return len(self._subs)
+
+    def _wanted(self) -> bool:
+        # The listener only runs while someone is watching.
+        return bool(self._subs)
+
+    def _on_connect(self, first: bool):
+        if not first:
+            self._publish([("resync", None)])
+
+    def _handle(self, notifies: list):
+        self._publish(self._events(notifies))
+
+    def _publish(self, events: list):
+        with self._lock:
+            subs = list(self._subs.items())
+        for q, loop in subs:
+            try:
+                loop.call_soon_threadsafe(self._deliver, q, events)
+            except RuntimeError:  # loop closed without unsubscribing
+                self.unsubscribe(q)
+
+    def _deliver(self, q: asyncio.Queue, events: list):
+        # Runs on the subscriber's loop. A client too slow to keep up gets one
+        # resync instead of an ever-growing backlog.
+        for ev in events:
+            try:
+                q.put_nowait(ev)
+            except asyncio.QueueFull:
+                while not q.empty():
+                    q.get_nowait()
+                q.put_nowait(("resync", None))
+                return
+
+    def _events(self, notifies: list) -> list:
+        ids = {"users": set(), "withdrawals": set()}
+        resync = False
+        for n in notifies:
+            msg = json.loads(n.payload)
+            if msg.get("ids") is None:
+                resync = True
+            elif msg.get("table") in ids:
+                ids[msg["table"]].update(msg["ids"])
+        events = [("resync", None)] if resync else []
+        for table, found in ids.items():
+            if found and not resync:
+                rows = db.rows_by_id(table, sorted(found))
+                gone = found - {r["id"] for r in rows}
+                events.append((table, rows + [{"id": i, "deleted": True} for i in sorted(gone)]))
+        events.append(("summary", db.admin_summary(primary=True)))
+        return events
+
+admin_events = EventHub()
@@ -0,0 +1,218 @@
+"""Equity-curve PNGs for /graph.
+
+Rendering (pandas + matplotlib) runs in a small process pool so it never blocks
+the bot's event loop or holds the GIL. Images are cached on disk under
+GRAPH_CACHE_DIR, keyed by the trade log's version (size, mtime, row count) and
+the chart parameters, so repeat requests are served without rendering; many
+users asking at once for the same chart share one render. The newest
+GRAPH_CACHE_FILES images are kept.
+
+Scripts that keep a chart at one fixed path use stale_chart() / chart_rendered()
+with the same key, stored beside the image.
+"""
+import os
+import asyncio
+import hashlib
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+import pandas as pd
+
+log = logging.getLogger("trustmeai.graph")
+
+GRAPH_CACHE_DIR = os.getenv("GRAPH_CACHE_DIR", "state/graphs")
+GRAPH_CACHE_FILES = int(os.getenv("GRAPH_CACHE_FILES", "50"))
+GRAPH_WORKERS = int(os.getenv("GRAPH_WORKERS", "1"))
+GRAPH_MAX_POINTS = 5000    # longer curves are thinned to about this many points
+GRAPH_CHUNK_ROWS = 500_000  # trade log rows read at a time while rendering
+
+def _pnl_values(col: pd.Series) -> np.ndarray:
+    """pnl as float64 the way /summary counts it: empty -> 0, non-numeric values dropped."""
+    if col.dtype != np.float64:
+        raw = col.astype("string").str.strip()
+        num = pd.to_numeric(raw, errors="coerce")
+        col = num[~(num.isna() & raw.fillna("").ne(""))]
+    return np.nan_to_num(col.to_numpy(dtype=np.float64), nan=0.0)
+
+def _equity_points(path: str, last: int = None, max_points: int = GRAPH_MAX_POINTS) -> tuple:
+    """(trade numbers, cumulative PnL) to plot, read in chunks so memory stays bounded."""
+    xs, ys, step, n, total = [], [], 1, 0, 0.0
+    if last:
+        xs, ys = np.empty(0, dtype=np.int64), np.empty(0)
+    # Rows with the wrong number of fields are skipped, as TradeStats does.
+    for chunk in pd.read_csv(path, usecols=["pnl"], chunksize=GRAPH_CHUNK_ROWS,
+                             on_bad_lines="skip", encoding_errors="replace"):
+        pnl = _pnl_values(chunk["pnl"])
+        buf = np.empty(pnl.size + 1)
+        buf[0] = total
+        buf[1:] = pnl
+        cum = np.cumsum(buf)[1:]
+        idx = np.arange(n + 1, n + 1 + cum.size)
+        n, total = n + cum.size, float(cum[-1]) if cum.size else total
+        if last:
+            # keep only the trailing `last` points; thinned once at the end
+            xs, ys = np.concatenate((xs, idx))[-last:], np.concatenate((ys, cum))[-last:]
+            continue
+        keep = idx % step == 0
+        xs += idx[keep].tolist()
+        ys += cum[keep].tolist()
+        while len(xs) > 2 * max_points:
+            step *= 2
+            xs, ys = xs[1::2], ys[1::2]
+    xs, ys = np.asarray(xs), np.asarray(ys)
+    if last and xs.size > max_points:
+        pick = np.linspace(0, xs.size - 1, max_points).astype(int)
+        xs, ys = xs[pick], ys[pick]
+    if n and (not xs.size or xs[-1] != n):
+        xs, ys = np.append(xs, n), np.append(ys, total)  # always end on the latest equity
+    return xs, ys
+
+def chart_key(path: str, rows: int, params: dict) -> str:
+    """Identifies a chart of `path`: the log's version (size, mtime, row count) and the chart parameters."""
+    st = os.stat(path)
+    key = repr((os.path.abspath(path), st.st_size, st.st_mtime_ns, rows, sorted(params.items())))
+    return hashlib.sha1(key.encode()).hexdigest()[:16]
+
+def count_lines(path: str, block: int = 1 << 20) -> int:
+    """Line breaks in `path`, read in blocks; the row count for callers without a TradeStats."""
+    n = 0
+    with open(path, "rb") as f:
+        while True:
+            buf = f.read(block)
+            if not buf:
+                return n
+            n += buf.count(b"\n")
+
+def stale_chart(png: str, path: str, **params):
+    """Key to render `png` under when it is missing or was drawn from another version of `path`
+    or with other `params`; None when it is current. Taken before reading the log, so a write
+    during the render leaves the chart stale rather than wrongly current."""
+    key = chart_key(path, count_lines(path), params)
+    try:
+        with open(f"{png}.key") as f:
+            if f.read() == key and os.path.exists(png):
+                return None
+    except FileNotFoundError:
+        pass
+    return key
+
+def chart_rendered(png: str, key: str):
+    """Record that `png` now shows the version `key` from stale_chart()."""
+    tmp = f"{png}.key.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        f.write(key)
+    os.replace(tmp, f"{png}.key")
+
+def render_equity_png(path: str, out: str, last: int = None, width: float = 10.0, height: float = 4.0) -> str:
+    """Draw the equity curve of `path` into `out` (atomically). Runs in a worker process."""
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    xs, ys = _equity_points(path, last)
+    fig, ax = plt.subplots(figsize=(width, height), dpi=100)
+    ax.plot(xs, ys, linewidth=1.2, color="#6C5CE7")
+    ax.axhline(0, color="grey", linewidth=0.6)
+    ax.set_title(f"Equity Curve — last {last} trades" if last else "Equity Curve")
+    ax.set_xlabel("Trade #")
+    ax.set_ylabel("Cumulative PnL")
+    ax.grid(True, alpha=0.3)
+    fig.tight_layout()
+    tmp = f"{out}.{os.getpid()}.tmp"
+    fig.savefig(tmp, format="png")
+    plt.close(fig)
+    os.replace(tmp, out)
+    return out
+
+class GraphCache:
+    """Rendered charts on disk, plus what Telegram already has uploaded."""
+
+    def __init__(self, cache_dir: str = GRAPH_CACHE_DIR, workers: int = GRAPH_WORKERS, keep: int = GRAPH_CACHE_FILES):
+        self.cache_dir = cache_dir
+        self.workers = workers
+        self.keep = keep
+        self._executor = None
+        self._inflight = {}   # cache file -> future of the render producing it
+        self._file_ids = {}   # cache file -> Telegram file_id of an earlier upload
+        self._stats = {"hits": 0, "renders": 0, "shared": 0, "errors": 0}
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn: forking a process that runs DB and event-loop threads is unsafe
+            self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._executor
+
+    def _path(self, path: str, rows: int, params: dict) -> str:
+        return os.path.join(self.cache_dir, f"equity-{chart_key(path, rows, params)}.png")
+
+    def _prune(self, serving: str):
+        # Least recently served first (hits touch their file); never the image about to be
+        # returned or one a render is still producing for waiting callers.
+        try:
+            files = sorted((e for e in os.scandir(self.cache_dir) if e.name.endswith(".png")),
+                           key=lambda e: e.stat().st_mtime, reverse=True)
+        except FileNotFoundError:
+            return
+        for e in files[self.keep:]:
+            if e.path == serving or e.path in self._inflight:
+                continue
+            try:
+                os.remove(e.path)
+            except OSError:
+                pass
+            self._file_ids.pop(e.path, None)
+
+    async def equity_png(self, path: str, rows: int, **params) -> str:
+        """Path of the cached PNG for this version of `path` (`rows` = its trade count), rendering it if needed.
+
+        Raises FileNotFoundError if the log is gone.
+        """
+        out = self._path(path, rows, params)
+        try:
+            os.utime(out)  # a hit: mark it recently served for _prune
+            self._stats["hits"] += 1
+            return out
+        except FileNotFoundError:
+            pass
+        fut = self._inflight.get(out)
+        if fut is not None:
+            self._stats["shared"] += 1
+            return await asyncio.shield(fut)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        fut = asyncio.get_running_loop().run_in_executor(self._pool(), render_equity_png, path, out,
+                                                          params.get("last"), params.get("width", 10.0), params.get("height", 4.0))
+        self._inflight[out] = fut
+        try:
+            await asyncio.shield(fut)
+            self._stats["renders"] += 1
+        except Exception as e:
+            self._stats["errors"] += 1
+            if isinstance(e, BrokenProcessPool):
+                log.warning("Graph worker died; starting a new pool for the next render")
+                self._executor = None
+            raise
+        finally:
+            self._inflight.pop(out, None)
+        self._prune(out)
+        return out
+
+    def file_id(self, png: str):
+        return self._file_ids.get(png)
+
+    def remember(self, png: str, file_id: str):
+        self._file_ids[png] = file_id
+
+    def stats(self) -> dict:
+        out = dict(self._stats)
+        out["inflight"] = len(self._inflight)
+        return out
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+graph_cache = GraphCache()
@@ -0,0 +1,220 @@
+"""Versioned SQL migrations.
+
+Files in migrations/ are named NNNN_description.sql and applied in order, each
+in its own transaction. Applied versions are recorded with a SHA-256 checksum
+in the schema_version ledger; an advisory lock keeps concurrent runners (bot,
+API workers, /migrate) from applying the same step twice.
+
+A file whose first line is `-- migrate: no-transaction` is instead run one
+statement at a time in autocommit, for CREATE/DROP INDEX CONCURRENTLY. Its
+statements must be idempotent (IF [NOT] EXISTS) and contain no `;` other than
+the terminating one; an index left INVALID by an interrupted build is dropped
+and rebuilt on the next run.
+
+    python -m bot.migrate            # apply pending migrations
+    python -m bot.migrate --status   # show applied/pending
+"""
+import os
+import re
+import sys
+import time
+import hashlib
+import logging
+from functools import lru_cache
+from collections import namedtuple
+
+import psycopg2
+import psycopg2.extras
+
+log = logging.getLogger("trustmeai.migrate")
+
+MIGRATIONS_DIR = os.getenv("MIGRATIONS_DIR") or os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "migrations")
+ADVISORY_LOCK_KEY = 7_462_001  # arbitrary, shared by every runner
+
+Migration = namedtuple("Migration", "version name sql checksum transactional")
+
+NO_TRANSACTION = "-- migrate: no-transaction"
+
+# Checksums of earlier revisions of a migration that produce the same schema;
+# a database that applied one is treated as current and its ledger updated.
+PREVIOUS_CHECKSUMS = {
+    4: {"b2e996014b827176f0e39f64a1acdccc808d72148aed97b3136a03cd45320620"},  # before CONCURRENTLY
+}
+
+class MigrationError(RuntimeError):
+    pass
+
+_LEDGER_SQL = """
+CREATE TABLE IF NOT EXISTS schema_version (
+  version INTEGER PRIMARY KEY,
+  applied_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+ALTER TABLE schema_version ADD COLUMN IF NOT EXISTS name TEXT;
+ALTER TABLE schema_version ADD COLUMN IF NOT EXISTS checksum TEXT;
+"""
+
+@lru_cache(maxsize=None)
+def load_migrations(path: str = MIGRATIONS_DIR) -> tuple:
+    out = []
+    for fname in sorted(os.listdir(path)):
+        m = re.match(r"^(\d+)_(.+)\.sql$", fname)
+        if not m:
+            continue
+        with open(os.path.join(path, fname), "r", encoding="utf-8") as f:
+            sql = f.read()
+        out.append(Migration(int(m.group(1)), m.group(2), sql, hashlib.sha256(sql.encode("utf-8")).hexdigest(),
+                             not sql.startswith(NO_TRANSACTION)))
+    versions = [m.version for m in out]
+    if len(versions) != len(set(versions)):
+        raise MigrationError(f"Duplicate migration versions in {path}")
+    return tuple(out)
+
+def latest_version() -> int:
+    migrations = load_migrations()
+    return migrations[-1].version if migrations else 0
+
+def _connect(dsn: str = None):
+    dsn = dsn or os.getenv("DATABASE_URL")
+    if not dsn:
+        raise RuntimeError("DATABASE_URL is not set")
+    return psycopg2.connect(dsn, cursor_factory=psycopg2.extras.RealDictCursor)
+
+def _applied(cur) -> dict:
+    cur.execute("SELECT to_regclass('schema_version') IS NOT NULL AS present")
+    if not cur.fetchone()["present"]:
+        return {}
+    cur.execute("SELECT * FROM schema_version")
+    return {r["version"]: r.get("checksum") for r in cur.fetchall()}
+
+def _pending(applied: dict) -> list:
+    pending = []
+    for m in load_migrations():
+        if m.version not in applied:
+            pending.append(m)
+        elif applied[m.version] and applied[m.version] != m.checksum \
+                and applied[m.version] not in PREVIOUS_CHECKSUMS.get(m.version, ()):
+            raise MigrationError(f"Migration {m.version:04d}_{m.name} was modified after it was applied")
+    return pending
+
+def _statements(sql: str) -> list:
+    lines = [l for l in sql.splitlines() if l.strip() and not l.lstrip().startswith("--")]
+    return [st.strip() for st in "\n".join(lines).split(";") if st.strip()]
+
+def _run_without_transaction(conn, cur, m: Migration):
+    conn.commit()
+    conn.autocommit = True
+    try:
+        for st in _statements(m.sql):
+            idx = re.match(r"CREATE\s+(?:UNIQUE\s+)?INDEX\s+CONCURRENTLY\s+IF\s+NOT\s+EXISTS\s+(\w+)", st, re.I)
+            if idx:
+                # A failed concurrent build leaves an INVALID index that IF NOT EXISTS would keep.
+                cur.execute("""SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+                               WHERE c.relname = %s AND NOT i.indisvalid""", (idx.group(1),))
+                if cur.fetchone():
+                    log.warning(f"Dropping invalid index {idx.group(1)} left by an interrupted build")
+                    cur.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {idx.group(1)}")
+            cur.execute(st)
+    finally:
+        conn.autocommit = False
+
+def _lock(conn, cur):
+    # Poll instead of blocking in pg_advisory_lock(): a session waiting there holds a
+    # snapshot, and CREATE INDEX CONCURRENTLY in the lock holder would wait for it forever.
+    while True:
+        cur.execute("SELECT pg_try_advisory_lock(%s) AS ok", (ADVISORY_LOCK_KEY,))
+        ok = cur.fetchone()["ok"]
+        conn.commit()
+        if ok:
+            return
+        time.sleep(0.5)
+
+def applied_version(cur) -> int:
+    """Highest applied version, on an existing cursor (0 before the first migration)."""
+    cur.execute("SELECT to_regclass('schema_version') IS NOT NULL AS present")
+    if not cur.fetchone()["present"]:
+        return 0
+    cur.execute("SELECT COALESCE(MAX(version), 0) AS version FROM schema_version")
+    return cur.fetchone()["version"]
+
+def current_version(dsn: str = None) -> int:
+    conn = _connect(dsn)
+    try:
+        with conn.cursor() as cur:
+            return applied_version(cur)
+    finally:
+        conn.close()
+
+def pending_migrations(dsn: str = None) -> list:
+    conn = _connect(dsn)
+    try:
+        with conn.cursor() as cur:
+            return _pending(_applied(cur))
+    finally:
+        conn.close()
+
+def migrate(dsn: str = None) -> list:
+    """Apply pending migrations; returns the names applied (empty when current)."""
+    conn = _connect(dsn)
+    try:
+        with conn.cursor() as cur:
+            # Fast path: nothing to do, no lock taken.
+            if not _pending(_applied(cur)):
+                conn.rollback()
+                return []
+            conn.rollback()
+            _lock(conn, cur)
+            try:
+                cur.execute(_LEDGER_SQL)
+                conn.commit()
+                applied = _applied(cur)
+                done = []
+                for m in _pending(applied):
+                    log.info(f"Applying migration {m.version:04d}_{m.name}")
+                    try:
+                        if m.transactional:
+                            cur.execute(m.sql)
+                        else:
+                            _run_without_transaction(conn, cur, m)
+                        cur.execute("""INSERT INTO schema_version (version, name, checksum) VALUES (%s,%s,%s)
+                                       ON CONFLICT (version) DO UPDATE SET name=EXCLUDED.name, checksum=EXCLUDED.checksum""",
+                                    (m.version, m.name, m.checksum))
+                        conn.commit()
+                    except Exception:
+                        conn.rollback()
+                        raise
+                    done.append(f"{m.version:04d}_{m.name}")
+                # Adopt rows recorded before checksums existed, or by an earlier equivalent revision.
+                cur.execute("SELECT version, checksum FROM schema_version")
+                known = {m.version: m for m in load_migrations()}
+                for r in cur.fetchall():
+                    m = known.get(r["version"])
+                    if m and r["checksum"] != m.checksum:
+                        cur.execute("UPDATE schema_version SET name=%s, checksum=%s WHERE version=%s", (m.name, m.checksum, m.version))
+                conn.commit()
+                return done
+            finally:
+                if not conn.closed:
+                    # A failed statement leaves the transaction aborted; the unlock would
+                    # fail too and hide the original error.
+                    conn.rollback()
+                    cur.execute("SELECT pg_advisory_unlock(%s)", (ADVISORY_LOCK_KEY,))
+                    conn.commit()
+    finally:
+        conn.close()
+
+def main(argv=None):
+    logging.basicConfig(level=logging.INFO)
+    argv = sys.argv[1:] if argv is None else argv
+    if "--status" in argv:
+        version = current_version()
+        pending = pending_migrations()
+        print(f"schema version {version} (latest {latest_version()})")
+        for m in pending:
+            print(f"pending: {m.version:04d}_{m.name}")
+        return 0
+    done = migrate()
+    print("\n".join(f"applied: {name}" for name in done) or "schema up to date")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,113 @@
+"""Postgres LISTEN loop shared by the admin event stream and the user cache.
+
+A NotifyListener runs one daemon thread per process holding a dedicated
+autocommit connection that LISTENs on admin_events (migrations/0007). Each
+wake-up drains the notifications, waiting up to `coalesce` seconds for more so
+a burst is handled in one go, and passes the batch to _handle(). On a dropped
+connection it reconnects with backoff; _on_connect() / _on_disconnect() let
+subclasses react to the gap, during which notifications are lost.
+"""
+import time
+import select
+import logging
+import threading
+
+import psycopg2
+import psycopg2.extensions
+
+from .pool import DATABASE_URL, _backoff, DB_CONNECT_RETRIES
+
+log = logging.getLogger("trustmeai.notify")
+
+CHANNEL = "admin_events"
+
+class NotifyListener:
+    thread_name = "pg-listen"
+
+    def __init__(self, dsn: str = None, coalesce: float = 0.0):
+        self.dsn = dsn or DATABASE_URL
+        self.coalesce = coalesce
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        self._connected = False
+
+    def start(self):
+        """Start the listener thread unless it is already running."""
+        with self._lock:
+            if self._thread is None:
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name=self.thread_name, daemon=True)
+                self._thread.start()
+
+    def close(self):
+        self._stop.set()
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout=5)
+
+    def connected(self) -> bool:
+        """True while LISTEN is active, i.e. no notification is being missed."""
+        return self._connected
+
+    def _wanted(self) -> bool:
+        # Called under self._lock; the thread exits when this turns False.
+        return True
+
+    def _on_connect(self, first: bool):
+        pass
+
+    def _on_disconnect(self):
+        pass
+
+    def _handle(self, notifies: list):
+        raise NotImplementedError
+
+    def _listen(self):
+        conn = _backoff(lambda: psycopg2.connect(self.dsn), DB_CONNECT_RETRIES, "Notification listener connect")
+        conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        with conn.cursor() as cur:
+            cur.execute(f"LISTEN {CHANNEL}")
+        return conn
+
+    def _run(self):
+        conn, first = None, True
+        while True:
+            with self._lock:
+                if self._stop.is_set() or not self._wanted():
+                    self._thread = None
+                    break
+            try:
+                if conn is None:
+                    conn = self._listen()
+                    self._on_connect(first)
+                    self._connected, first = True, False
+                if not select.select([conn], [], [], 1.0)[0]:
+                    continue
+                deadline = time.monotonic() + self.coalesce
+                while True:
+                    conn.poll()
+                    wait = deadline - time.monotonic()
+                    if wait <= 0 or not select.select([conn], [], [], wait)[0]:
+                        break
+                conn.poll()
+                payloads, conn.notifies[:] = list(conn.notifies), []
+                if payloads:
+                    self._handle(payloads)
+            except Exception as e:
+                log.warning(f"{self.thread_name} listener failed ({e}); reconnecting")
+                if self._connected:
+                    self._connected = False
+                    self._on_disconnect()
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except psycopg2.Error:
+                        pass
+                conn = None
+                time.sleep(1.0)
+        if self._connected:
+            self._connected = False
+            self._on_disconnect()
+        if conn is not None:
+            conn.close()
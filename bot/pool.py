@@ -0,0 +1,320 @@
+import os
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+import psycopg2
+import psycopg2.extras
+
+log = logging.getLogger("trustmeai.pool")
+
+DATABASE_URL = os.getenv("DATABASE_URL")
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))        # seconds to wait for a free connection
+DB_POOL_HEALTHCHECK = float(os.getenv("DB_POOL_HEALTHCHECK", "30"))  # ping connections idle longer than this
+DB_CONNECT_RETRIES = int(os.getenv("DB_CONNECT_RETRIES", "5"))
+DATABASE_REPLICA_URL = os.getenv("DATABASE_REPLICA_URL")
+REPLICA_MAX_LAG = float(os.getenv("REPLICA_MAX_LAG_SECONDS", "5"))      # fall back to the primary beyond this
+REPLICA_CHECK_INTERVAL = float(os.getenv("REPLICA_CHECK_INTERVAL", "2"))  # seconds between lag probes
+
+class PoolTimeout(RuntimeError):
+    """Raised when no connection becomes free within the checkout timeout."""
+
+def _backoff(fn, retries: int, what: str):
+    delay = 0.2
+    for attempt in range(retries + 1):
+        try:
+            return fn()
+        except psycopg2.OperationalError as e:
+            if attempt >= retries:
+                raise
+            log.warning(f"{what} failed ({e}); retrying in {delay:.1f}s")
+            time.sleep(delay)
+            delay = min(delay * 2, 5.0)
+
+class Pool:
+    """Thread-safe psycopg2 pool with bounded waits, health checks and stats.
+
+    Idle connections are kept (up to `maxconn`) instead of being closed down to
+    `minconn` as psycopg2's own pools do; a semaphore caps the number checked out
+    and makes callers wait up to `timeout` for one to be returned.
+    """
+
+    def __init__(self, dsn: str, minconn: int = DB_POOL_MIN, maxconn: int = DB_POOL_MAX,
+                 timeout: float = DB_POOL_TIMEOUT, healthcheck: float = DB_POOL_HEALTHCHECK,
+                 retries: int = DB_CONNECT_RETRIES):
+        self.dsn = dsn
+        self.minconn = max(0, minconn)
+        self.maxconn = max(1, maxconn, self.minconn)
+        self.timeout = timeout
+        self.healthcheck = healthcheck
+        self.retries = retries
+        self._slots = threading.BoundedSemaphore(self.maxconn)
+        self._lock = threading.Lock()
+        self._idle = []  # (conn, last_used) — used LIFO so hot connections stay warm
+        self._size = 0
+        self._in_use = 0
+        self._closed = False
+        self._stats = {"checkouts": 0, "connects": 0, "waits": 0, "timeouts": 0, "reconnects": 0, "discarded": 0, "peak_in_use": 0}
+        for _ in range(self.minconn):
+            conn = self._connect()
+            self._idle.append((conn, time.monotonic()))
+
+    def _connect(self):
+        conn = _backoff(
+            lambda: psycopg2.connect(self.dsn, cursor_factory=psycopg2.extras.RealDictCursor),
+            self.retries, "DB connect")
+        with self._lock:
+            self._size += 1
+            self._stats["connects"] += 1
+        return conn
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+        with self._lock:
+            self._size -= 1
+            self._stats["discarded"] += 1
+
+    def _alive(self, conn, last_used: float) -> bool:
+        if conn.closed:
+            return False
+        if time.monotonic() - last_used < self.healthcheck:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def getconn(self):
+        if self._closed:
+            raise RuntimeError("Pool is closed")
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._stats["waits"] += 1
+            if not self._slots.acquire(timeout=self.timeout):
+                with self._lock:
+                    self._stats["timeouts"] += 1
+                raise PoolTimeout(f"No DB connection free after {self.timeout:.0f}s (max {self.maxconn})")
+        try:
+            conn = None
+            while conn is None:
+                with self._lock:
+                    item = self._idle.pop() if self._idle else None
+                if item is None:
+                    conn = self._connect()
+                elif self._alive(*item):
+                    conn = item[0]
+                else:
+                    self._discard(item[0])
+                    with self._lock:
+                        self._stats["reconnects"] += 1
+        except Exception:
+            self._slots.release()
+            raise
+        with self._lock:
+            self._in_use += 1
+            self._stats["checkouts"] += 1
+            self._stats["peak_in_use"] = max(self._stats["peak_in_use"], self._in_use)
+        return conn
+
+    def putconn(self, conn, close: bool = False):
+        try:
+            if not close and not conn.closed:
+                try:
+                    if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                        conn.rollback()
+                except psycopg2.Error:
+                    close = True
+            if close or conn.closed or self._closed:
+                self._discard(conn)
+            else:
+                with self._lock:
+                    self._idle.append((conn, time.monotonic()))
+        finally:
+            with self._lock:
+                self._in_use -= 1
+            self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        """Check out a connection; commit on success, roll back on error."""
+        conn = self.getconn()
+        broken = False
+        try:
+            yield conn
+            conn.commit()
+        except Exception as e:
+            broken = isinstance(e, (psycopg2.OperationalError, psycopg2.InterfaceError))
+            if not conn.closed:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    broken = True
+            raise
+        finally:
+            self.putconn(conn, close=broken)
+
+    def stats(self) -> dict:
+        with self._lock:
+            out = dict(self._stats)
+            out.update({
+                "size": self._size,
+                "in_use": self._in_use,
+                "idle": len(self._idle),
+                "min": self.minconn,
+                "max": self.maxconn,
+                "saturation": round(self._in_use / self.maxconn, 3),
+            })
+        return out
+
+    def closeall(self):
+        self._closed = True
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn, _ in idle:
+            self._discard(conn)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool() -> Pool:
+    """Process-wide pool for DATABASE_URL, created on first use."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                if not DATABASE_URL:
+                    raise RuntimeError("DATABASE_URL is not set")
+                _pool = Pool(DATABASE_URL)
+    return _pool
+
+# Seconds the replica is behind: 0 when it has replayed everything it received
+# (an idle primary is not lag) or when the server is not a standby at all; NULL
+# when no WAL receiver is streaming, since a standby cut off from the primary has
+# also replayed all it received and would otherwise look current forever.
+# Without pg_read_all_stats the receiver's status reads NULL; its row still shows it runs.
+_LAG_SQL = """
+SELECT CASE WHEN NOT pg_is_in_recovery() THEN 0
+            WHEN NOT EXISTS (SELECT 1 FROM pg_stat_wal_receiver
+                             WHERE COALESCE(status, 'streaming') = 'streaming') THEN NULL
+            WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+            ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+       END AS lag
+"""
+
+class ReplicaRouter:
+    """Picks the pool for read-only queries.
+
+    Reads go to DATABASE_REPLICA_URL while it answers and is no more than
+    REPLICA_MAX_LAG_SECONDS behind (probed at most every REPLICA_CHECK_INTERVAL);
+    otherwise, or when no replica is configured, they go to the primary.
+    """
+
+    def __init__(self, dsn: str = DATABASE_REPLICA_URL, max_lag: float = REPLICA_MAX_LAG,
+                 interval: float = REPLICA_CHECK_INTERVAL):
+        self.max_lag = max_lag
+        self.interval = interval
+        # No eager connects or retry loops: an unreachable replica should cost one
+        # failed probe, not stall the caller.
+        self.replica = Pool(dsn, minconn=0, retries=0) if dsn else None
+        self._lock = threading.Lock()
+        self._next_check = 0.0
+        self._healthy = None  # unknown until the first probe
+        self._lag = None
+        self._stats = {"replica_reads": 0, "primary_reads": 0, "lag_checks": 0, "failovers": 0}
+
+    def _probe(self):
+        streaming = True
+        try:
+            with self.replica.connection() as conn:
+                with conn.cursor() as cur:
+                    cur.execute(_LAG_SQL)
+                    lag = cur.fetchone()["lag"]
+            streaming = lag is not None
+            lag = float(lag) if streaming else None
+            healthy = streaming and lag <= self.max_lag
+        except (psycopg2.Error, PoolTimeout) as e:
+            lag, healthy = None, False
+            log.warning(f"Read replica unavailable ({e}); reading from primary")
+        if healthy != self._healthy:
+            if healthy:
+                log.info(f"Read replica in use (lag {lag:.1f}s)")
+            else:
+                if self._healthy:
+                    self._stats["failovers"] += 1
+                if lag is not None:
+                    log.warning(f"Read replica {lag:.1f}s behind (max {self.max_lag:.0f}s); reading from primary")
+                elif not streaming:
+                    log.warning("Read replica is not streaming from the primary; reading from primary")
+        self._healthy, self._lag = healthy, lag
+
+    def mark_failed(self):
+        """Stop using the replica until the next successful probe."""
+        with self._lock:
+            if self._healthy:
+                self._stats["failovers"] += 1
+            self._healthy, self._lag = False, None
+            self._next_check = time.monotonic() + self.interval
+
+    def pool(self) -> Pool:
+        if self.replica is not None:
+            if time.monotonic() >= self._next_check and self._lock.acquire(blocking=False):
+                # One thread probes; the rest keep using the last verdict meanwhile.
+                try:
+                    self._stats["lag_checks"] += 1
+                    self._probe()
+                    self._next_check = time.monotonic() + self.interval
+                finally:
+                    self._lock.release()
+            if self._healthy:
+                self._stats["replica_reads"] += 1
+                return self.replica
+        self._stats["primary_reads"] += 1
+        return get_pool()
+
+    def stats(self) -> dict:
+        out = dict(self._stats)
+        out.update({"configured": self.replica is not None, "healthy": bool(self._healthy),
+                    "lag": self._lag, "max_lag": self.max_lag})
+        if self.replica is not None:
+            out["pool"] = self.replica.stats()
+        return out
+
+    def close(self):
+        if self.replica is not None:
+            self.replica.closeall()
+
+_router = None
+
+def get_read_router() -> ReplicaRouter:
+    """Process-wide router for read-only queries, created on first use."""
+    global _router
+    if _router is None:
+        with _pool_lock:
+            if _router is None:
+                _router = ReplicaRouter()
+    return _router
+
+def replica_stats() -> dict:
+    return _router.stats() if _router is not None else {"configured": bool(DATABASE_REPLICA_URL)}
+
+def pool_stats() -> dict:
+    return _pool.stats() if _pool is not None else {"size": 0, "in_use": 0, "idle": 0, "max": DB_POOL_MAX, "saturation": 0.0}
+
+def close_pool():
+    global _pool, _router
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
+        if _router is not None:
+            _router.close()
+            _router = None
@@ -1,21 +1,82 @@
 import numpy as np, pandas as pd
 from .utils import safe_html
 
+def summary_from_totals(trades:int, wins:int, losses:int, net:float, gross_profit:float, gross_loss:float, max_dd:float)->dict:
+    """The summarize_df figures from running totals (gross_loss is positive, max_dd <= 0)."""
+    if trades==0:
+        return {'trades':0,'wins':0,'losses':0,'win_rate':0.0,'net_pnl':0.0,'avg_win':0.0,'avg_loss':0.0,'max_drawdown':0.0,'profit_factor':0.0}
+    return {'trades':int(trades),'wins':int(wins),'losses':int(losses),'win_rate':wins/trades*100.0,'net_pnl':float(net),
+            'avg_win':gross_profit/wins if wins else 0.0,'avg_loss':-gross_loss/losses if losses else 0.0,
+            'max_drawdown':float(max_dd),'profit_factor':gross_profit/gross_loss if gross_loss>0 else 0.0}
+
+SUMMARY_CHUNK_ROWS=1_000_000  # rows per block when summarizing a CSV from disk
+
+class PnlAccumulator:
+    """Running summarize_df totals that can be fed a PnL series in chunks.
+
+    add() folds the next chunk in order; every sum is carried sequentially, so
+    any chunking gives bit-identical results to one add() over the whole series.
+    merge() combines accumulators built independently over consecutive pieces
+    (e.g. in parallel); that is exact up to float rounding of the sums. NaN PnL
+    counts as 0 and is tallied in `missing`.
+    """
+    FIELDS=('n','wins','losses','missing','total','gross_profit','gross_loss','max_cum','min_cum','max_dd')
+
+    def __init__(self, **state):
+        self.n=self.wins=self.losses=self.missing=0
+        self.total=self.gross_profit=self.gross_loss=self.max_dd=0.0
+        self.max_cum=self.min_cum=None  # extremes of cumulative PnL; None until the first trade
+        for k,v in state.items(): setattr(self,k,v)
+
+    def add(self, pnl)->'PnlAccumulator':
+        a=np.asarray(pnl,dtype=np.float64)
+        if a.size==0: return self
+        nan=np.isnan(a)
+        if nan.any(): self.missing+=int(np.count_nonzero(nan)); a=np.where(nan,0.0,a)
+        # Each series is prefixed with the value carried from earlier chunks and accumulated
+        # in place, so the rounding matches one pass over everything.
+        cum=np.empty(a.size+1); cum[0]=self.total; cum[1:]=a; np.cumsum(cum,out=cum)
+        buf=np.empty(a.size+1); buf[0]=cum[1] if self.max_cum is None else self.max_cum; buf[1:]=cum[1:]
+        np.maximum.accumulate(buf,out=buf); self.max_cum=float(buf[-1])
+        np.subtract(cum[1:],buf[1:],out=buf[1:]); self.max_dd=min(self.max_dd,float(buf[1:].min()))
+        lo=float(cum[1:].min()); self.min_cum=lo if self.min_cum is None else min(self.min_cum,lo); self.total=float(cum[-1])
+        buf[0]=self.gross_profit; np.maximum(a,0.0,out=buf[1:]); np.cumsum(buf,out=buf); self.gross_profit=float(buf[-1])
+        buf[0]=self.gross_loss; np.minimum(a,0.0,out=buf[1:]); np.negative(buf[1:],out=buf[1:]); np.cumsum(buf,out=buf); self.gross_loss=float(buf[-1])
+        self.n+=int(a.size); self.wins+=int(np.count_nonzero(a>0)); self.losses+=int(np.count_nonzero(a<0))
+        return self
+
+    def merge(self, other:'PnlAccumulator')->'PnlAccumulator':
+        """Append `other`, accumulated over the trades that come right after these."""
+        if other.n==0: return self
+        if self.n==0: self.__init__(**other.to_dict()); return self
+        # other's curve is shifted up by our total; its dips also count against our peak
+        self.max_dd=min(self.max_dd,other.max_dd,self.total+other.min_cum-self.max_cum)
+        self.max_cum=max(self.max_cum,self.total+other.max_cum); self.min_cum=min(self.min_cum,self.total+other.min_cum)
+        self.n+=other.n; self.wins+=other.wins; self.losses+=other.losses; self.missing+=other.missing
+        self.total+=other.total; self.gross_profit+=other.gross_profit; self.gross_loss+=other.gross_loss
+        return self
+
+    def to_dict(self)->dict: return {k:getattr(self,k) for k in self.FIELDS}
+
+    def summary(self)->dict:
+        return summary_from_totals(self.n,self.wins,self.losses,self.total,self.gross_profit,self.gross_loss,self.max_dd)
+
+def summarize_array(pnl)->dict:
+    """summarize_df over a float64 array of per-trade PnL (NaN counts as 0), vectorized."""
+    return PnlAccumulator().add(pnl).summary()
+
 def summarize_df(df: pd.DataFrame)->dict:
-    out={}; n=len(df); out['trades']=int(n)
-    if n==0:
-        out.update({'wins':0,'losses':0,'win_rate':0.0,'net_pnl':0.0,'avg_win':0.0,'avg_loss':0.0,'max_drawdown':0.0,'profit_factor':0.0}); return out
-    pnl=df['pnl'].fillna(0).astype(float); wins=pnl[pnl>0]; losses=pnl[pnl<0]
-    net=float(pnl.sum()); win_rate=(len(wins)/n)*100.0
-    avg_win=float(wins.mean()) if len(wins) else 0.0; avg_loss=float(losses.mean()) if len(losses) else 0.0
-    cum=pnl.cumsum(); running_max=cum.cummax(); dd=cum-running_max; max_dd=float(dd.min()) if not dd.empty else 0.0
-    gp=float(wins.sum()) if len(wins) else 0.0; gl=float(-losses.sum()) if len(losses) else 0.0
-    pf=(gp/gl) if gl>0 else 0.0
-    out.update({'wins':int((pnl>0).sum()),'losses':int((pnl<0).sum()),'win_rate':float(win_rate),'net_pnl':net,'avg_win':avg_win,'avg_loss':avg_loss,'max_drawdown':max_dd,'profit_factor':float(pf)})
-    return out
+    if len(df)==0: return summarize_array(())
+    return summarize_array(df['pnl'].astype(float).to_numpy())
 
-def build_summary_text(df: pd.DataFrame, meta: dict)->str:
-    s=summarize_df(df); hints=[]
+def summarize_csv(path, chunksize:int=SUMMARY_CHUNK_ROWS, column:str='pnl')->dict:
+    """summarize_df(pd.read_csv(path)) in bounded memory: the file is read `chunksize` rows at a time."""
+    acc=PnlAccumulator()
+    for chunk in pd.read_csv(path,usecols=[column],chunksize=chunksize): acc.add(chunk[column].astype(float).to_numpy())
+    return acc.summary()
+
+def format_summary(s: dict, meta: dict)->str:
+    hints=[]
     if s['profit_factor']<1.2: hints.append('Low profit factor; tighten stops or improve entries.')
     if s['win_rate']<50: hints.append('Win rate < 50%; review trade quality and R:R.')
     if abs(s['max_drawdown'])>abs(s['net_pnl'])*0.6: hints.append('Drawdown is large vs profits; reduce size or diversify.')
@@ -31,3 +92,6 @@ def build_summary_text(df: pd.DataFrame, meta: dict)->str:
         esc_hints = [f"• {safe_html(h)}" for h in hints]
         text += "\n\n<b>Insights</b>\n" + "\n".join(esc_hints)
     return text
+
+def build_summary_text(df: pd.DataFrame, meta: dict)->str:
+    return format_summary(summarize_df(df), meta)
@@ -0,0 +1,93 @@
+"""Read the last lines of a CSV log without scanning the whole file.
+
+The file is read backwards from EOF (or from a given byte offset) in blocks
+until enough line breaks have been seen, so the cost depends on how much is
+returned, not on the file size. Every call also returns the byte offset at
+which its first line starts, or None once the first data line is reached;
+passing it back as `before` pages further back:
+
+    columns, rows, offset = tail_rows(path, 20)
+    columns, older, offset = tail_rows(path, 20, before=offset)
+
+`before` is clamped to the file and moved back to the start of its line, so a
+stale or hand-typed offset never yields a partial line.
+
+The header (first line) is never returned as a data row. Encodings must be
+ASCII-compatible (UTF-8 and friends); a UTF-8 BOM on the header is dropped.
+"""
+import os
+import csv
+
+TAIL_BLOCK = 64 * 1024
+
+def _tail(f, n: int, start: int, end: int) -> tuple:
+    """Raw lines (bytes) of the last n lines in [start, end) and the offset of the first."""
+    if n <= 0 or end <= start:
+        return [], end
+    pos, buf = end, b""
+    while pos > start:
+        step = min(TAIL_BLOCK, pos - start)
+        pos -= step
+        f.seek(pos)
+        buf = f.read(step) + buf
+        # n breaks before the final byte (which ends the last line) delimit n whole lines
+        if buf.count(b"\n", 0, len(buf) - 1) >= n:
+            break
+    body = buf[:-1] if buf.endswith(b"\n") else buf
+    lines = body.split(b"\n")[-n:]  # when pos > start the first piece is partial and falls off here
+    first = end - len(buf) + (len(body) - len(b"\n".join(lines)))
+    return lines, first
+
+def _line_start(f, pos: int, start: int) -> int:
+    """`pos` moved back to the start of the line it falls in (not before `start`)."""
+    while pos > start:
+        step = min(TAIL_BLOCK, pos - start)
+        f.seek(pos - step)
+        i = f.read(step).rfind(b"\n")
+        if i >= 0:
+            return pos - step + i + 1
+        pos -= step
+    return start
+
+def _end(f, start: int, before) -> int:
+    """Where reading back begins: EOF, or `before` clamped to [start, EOF] and snapped to a line start."""
+    size = os.fstat(f.fileno()).st_size
+    if before is None or before >= size:
+        return size
+    return _line_start(f, max(before, start), start)
+
+def _header(first: bytes, encoding: str) -> str:
+    return first.decode("utf-8-sig" if encoding.lower().replace("_", "-") == "utf-8" else encoding,
+                        errors="replace").rstrip("\r\n")
+
+def tail_lines(path: str, n: int = 10, before: int = None, encoding: str = "utf-8") -> tuple:
+    """(header line, last n data lines ending at byte `before` (default EOF), offset of the first or None)."""
+    with open(path, "rb") as f:
+        first = f.readline()
+        lines, offset = _tail(f, n, len(first), _end(f, len(first), before))
+    return (_header(first, encoding), [l.decode(encoding, errors="replace").rstrip("\r") for l in lines],
+            offset if offset > len(first) else None)
+
+def tail_rows(path: str, n: int = 10, before: int = None, encoding: str = "utf-8") -> tuple:
+    """(column names, last n rows as dicts, offset of the first row or None).
+
+    Like pandas' on_bad_lines="skip", rows with the wrong number of fields are
+    dropped; reading continues further back until n good rows are found or the
+    header is reached.
+    """
+    with open(path, "rb") as f:
+        first = f.readline()
+        columns = next(csv.reader([_header(first, encoding)]), [])
+        end = _end(f, len(first), before)
+        found = []  # (offset, row), oldest first
+        while len(found) < n and end > len(first):
+            lines, end = _tail(f, n, len(first), end)
+            good, pos = [], end
+            for raw in lines:
+                fields = next(csv.reader([raw.decode(encoding, errors="replace").rstrip("\r")]), [])
+                if len(fields) == len(columns):
+                    good.append((pos, dict(zip(columns, fields))))
+                pos += len(raw) + 1
+            found[:0] = good[max(0, len(good) - (n - len(found))):]
+    offset = found[0][0] if len(found) == n else end
+    return columns, [row for _, row in found], offset if offset > len(first) else None
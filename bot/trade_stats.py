@@ -0,0 +1,143 @@
+"""Incremental PnL statistics for the trade log (TRADES_PATH).
+
+The log is append-only, so instead of re-parsing it on every /summary the
+aggregator remembers the byte offset it has read up to, together with running
+totals (row count, net PnL, wins/losses, gross profit/loss, equity peak and max
+drawdown, kept in a summary.PnlAccumulator), and on each update() only parses
+the complete lines appended since. A partial last line is left for the next
+call. New lines are parsed a block at a time with pandas' C reader. If the
+file shrank, was replaced (different inode) or its beginning no longer matches
+what was read, the totals are rebuilt from scratch. The checkpoint is saved as JSON
+(TRADE_STATS_STATE) so a restarted bot resumes where it left off, and an
+unchanged file (same mtime and size) is answered without reading it.
+"""
+import io
+import os
+import csv
+import hashlib
+import logging
+import threading
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from .utils import load_json, save_json
+from .summary import PnlAccumulator
+
+log = logging.getLogger("trustmeai.trade_stats")
+
+TRADE_STATS_STATE = os.getenv("TRADE_STATS_STATE", "state/trade_stats.json")
+READ_BLOCK = 4 << 20  # bytes parsed per step while catching up
+_HEAD_BYTES = 4096     # prefix fingerprinted to notice a replaced file
+
+def _empty() -> dict:
+    return {"offset": 0, "ino": None, "head": None, "columns": None, "bad_rows": 0,
+            "pnl": PnlAccumulator().to_dict()}
+
+def _head(f, offset: int) -> str:
+    f.seek(0)
+    return hashlib.sha1(f.read(min(offset, _HEAD_BYTES))).hexdigest()
+
+class TradeStats:
+    """Running totals over a CSV trade log with a `pnl` column.
+
+    Figures match summary.summarize_df over the whole file: empty pnl counts as
+    0, wins are pnl > 0, losses pnl < 0, and max_drawdown is the deepest fall of
+    cumulative PnL below its running peak (<= 0). Rows whose pnl isn't a number
+    are counted in bad_rows and otherwise ignored.
+    """
+
+    def __init__(self, path: str, state_path: str = TRADE_STATS_STATE):
+        self.path = path
+        self.state_path = Path(state_path) if state_path else None
+        self._lock = threading.Lock()
+        saved = load_json(self.state_path) if self.state_path else {}
+        ok = saved.get("path") == os.path.abspath(path) and set(_empty()) <= set(saved)
+        self._state = saved if ok else _empty()
+        self._acc = PnlAccumulator(**self._state["pnl"])
+        self._seen = None  # (mtime_ns, size, inode) the totals were last brought up to date with
+        self._stats = {"updates": 0, "unchanged": 0, "rebuilds": 0, "bytes_read": 0}
+
+    def _reset(self, reason: str):
+        if self._state["offset"]:
+            log.info(f"Rebuilding trade stats for {self.path}: {reason}")
+        self._state = _empty()
+        self._acc = PnlAccumulator()
+        self._stats["rebuilds"] += 1
+
+    def _pnl(self, data: bytes) -> np.ndarray:
+        """The pnl column of a block of complete CSV lines as float64 (empty -> 0, bad values dropped)."""
+        cols = self._state["columns"]
+        if "pnl" not in cols:
+            return np.zeros(sum(1 for line in data.splitlines() if line.strip()))
+        col = pd.read_csv(io.BytesIO(data), header=None, names=range(len(cols)), usecols=[cols.index("pnl")],
+                          skip_blank_lines=True, on_bad_lines="skip", encoding_errors="replace").iloc[:, 0]
+        if col.dtype != np.float64:
+            # Some value isn't numeric: coerce, counting the non-empty ones that fail.
+            raw = col.astype("string").str.strip()
+            col = pd.to_numeric(raw, errors="coerce")
+            bad = col.isna() & raw.fillna("").ne("")
+            self._state["bad_rows"] += int(bad.sum())
+            col = col[~bad]
+        return col.to_numpy(dtype=np.float64)
+
+    def _catch_up(self, f, st) -> bool:
+        start, rebuilds = self._state["offset"], self._stats["rebuilds"]
+        if start:
+            if st.st_size < start:
+                self._reset("file was truncated")
+            elif st.st_ino != self._state["ino"] or _head(f, start) != self._state["head"]:
+                self._reset("file was replaced")
+        s = self._state
+        f.seek(s["offset"])
+        pending = b""
+        while True:
+            block = f.read(READ_BLOCK)
+            if not block:
+                break
+            self._stats["bytes_read"] += len(block)
+            data = pending + block
+            cut = data.rfind(b"\n") + 1
+            pending = data[cut:]
+            if not cut:
+                continue
+            body = data[:cut]
+            if s["columns"] is None:
+                first, _, body = body.partition(b"\n")
+                header = first.decode("utf-8-sig", errors="replace").rstrip("\r")
+                s["columns"] = [c.strip().lower() for c in next(csv.reader([header]), [])]
+            if body.strip():
+                self._acc.add(self._pnl(body))
+            s["offset"] += cut
+        s["ino"] = st.st_ino
+        s["head"] = _head(f, s["offset"])
+        return s["offset"] != start or self._stats["rebuilds"] != rebuilds
+
+    def update(self) -> dict:
+        """Fold in rows appended since the last call and return the summary.
+
+        Raises FileNotFoundError if the log does not exist.
+        """
+        with self._lock:
+            self._stats["updates"] += 1
+            st = os.stat(self.path)
+            if (st.st_mtime_ns, st.st_size, st.st_ino) == self._seen:
+                self._stats["unchanged"] += 1
+                return self.snapshot()
+            with open(self.path, "rb") as f:
+                st = os.fstat(f.fileno())
+                if self._catch_up(f, st) and self.state_path:
+                    self._state["pnl"] = self._acc.to_dict()
+                    save_json(self.state_path, {**self._state, "path": os.path.abspath(self.path)})
+            self._seen = (st.st_mtime_ns, st.st_size, st.st_ino)
+            return self.snapshot()
+
+    def snapshot(self) -> dict:
+        """summarize_df-style figures plus the equity peak, bad_rows and the offset read up to."""
+        out = self._acc.summary()
+        out.update({"peak": self._acc.max_cum or 0.0, "bad_rows": self._state["bad_rows"], "offset": self._state["offset"]})
+        return out
+
+    def stats(self) -> dict:
+        return dict(self._stats)
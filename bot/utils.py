@@ -1,4 +1,4 @@
-import os, json
+import os, json, html
 from pathlib import Path
 def load_json(path: Path, default=None):
     if not path.exists(): return default if default is not None else {}
@@ -7,3 +7,5 @@ def load_json(path: Path, default=None):
 def save_json(path: Path, data):
     path.parent.mkdir(parents=True, exist_ok=True)
     path.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding='utf-8')
+def safe_html(text)->str:
+    return html.escape(str(text), quote=False)
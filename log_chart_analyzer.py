@@ -1,5 +1,6 @@
 # log_chart_analyzer.py
 
+import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 import json
@@ -16,30 +17,55 @@ with open("telegram_config.json", "r") as f:
 LOG_FILE = "logs/autobot_log.csv"
 CHART_FILE = "logs/autobot_chart.png"
 DRAW_THRESHOLD = 0.25
+CHUNK_ROWS = 100_000   # log rows read at a time
+PLOT_POINTS = 5_000    # longer logs are thinned to about this many points for the chart
 
 def send_telegram_photo(photo_path, caption="📊 Trade Summary"):
     url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendPhoto"
     with open(photo_path, 'rb') as photo:
         requests.post(url, data={"chat_id": TELEGRAM_CHAT_ID, "caption": caption}, files={"photo": photo})
 
+def new_balance_stats():
+    return {"count": 0, "first": None, "prev": None, "last": None, "peak": None, "trough": None}
+
+def fold_balances(stats, balances):
+    """Update running balance stats (count, first, prev, last, peak, trough) with the next chunk."""
+    b = np.asarray(balances, dtype=float)
+    if not b.size:
+        return stats
+    tail = ([stats["last"]] if stats["count"] else []) + b[-2:].tolist()
+    stats.update({
+        "first": stats["first"] if stats["count"] else float(b[0]),
+        "prev": tail[-2] if len(tail) >= 2 else None,
+        "last": tail[-1],
+        "peak": max(stats["peak"], float(b.max())) if stats["count"] else float(b.max()),
+        "trough": min(stats["trough"], float(b.min())) if stats["count"] else float(b.min()),
+        "count": stats["count"] + int(b.size),
+    })
+    return stats
+
 def check_ai_warnings(balances, initial_balance):
+    """Warnings for a balance series: a list of balances or fold_balances() stats."""
+    stats = balances if isinstance(balances, dict) else fold_balances(new_balance_stats(), balances)
     warnings = []
+    if not stats["count"]:
+        return warnings
 
     # 1. Profit drop check
-    if len(balances) >= 2 and balances[-1] < balances[-2]:
+    if stats["prev"] is not None and stats["last"] < stats["prev"]:
         warnings.append("⚠️ Profit dropped after last trade.")
 
     # 2. Drawdown check
-    peak = max(balances)
-    trough = min(balances)
+    peak = stats["peak"]
+    trough = stats["trough"]
     drawdown = (peak - trough) / peak
     if drawdown > DRAW_THRESHOLD:
         warnings.append(f"⚠️ Drawdown exceeds 25%: {drawdown:.2%}")
 
     # 3. Unrealistic compound growth
-    growth = balances[-1] / initial_balance
-    if growth > 10 and len(balances) < 10:
-        warnings.append(f"⚠️ Unrealistic growth: {growth:.2f}x in {len(balances)} trades.")
+    growth = stats["last"] / initial_balance
+    if growth > 10 and stats["count"] < 10:
+        warnings.append(f"⚠️ Unrealistic growth: {growth:.2f}x in {stats['count']} trades.")
 
     return warnings
 
@@ -48,13 +74,25 @@ def analyze_log():
         print("❌ Log file not found:", LOG_FILE)
         return
 
-    df = pd.read_csv(LOG_FILE)
-    balances = df["Balance"].tolist()
-    initial_balance = balances[0] if balances else 1000
+    # Stream the log so its size doesn't matter: running stats for the warnings,
+    # and every `step`-th point for the chart (step doubles whenever it gets too dense).
+    stats, xs, ys, step = new_balance_stats(), [], [], 1
+    for chunk in pd.read_csv(LOG_FILE, usecols=["Balance"], chunksize=CHUNK_ROWS):
+        b = chunk["Balance"].to_numpy(dtype=float)
+        idx = np.arange(stats["count"], stats["count"] + b.size)
+        keep = idx % step == 0
+        xs += idx[keep].tolist()
+        ys += b[keep].tolist()
+        fold_balances(stats, b)
+        while len(xs) > 2 * PLOT_POINTS:
+            step *= 2
+            xs, ys = zip(*[(x, y) for x, y in zip(xs, ys) if x % step == 0])
+            xs, ys = list(xs), list(ys)
+    initial_balance = stats["first"] if stats["count"] else 1000
 
     # Plot the balance chart
     plt.figure()
-    plt.plot(balances, marker='o')
+    plt.plot(xs, ys, marker='o' if step == 1 else None)
     plt.title("Autobot Balance Over Time (From Log)")
     plt.xlabel("Trade #")
     plt.ylabel("Balance")
@@ -63,7 +101,7 @@ def analyze_log():
     plt.close()
 
     # AI analysis
-    warnings = check_ai_warnings(balances, initial_balance)
+    warnings = check_ai_warnings(stats, initial_balance)
     caption = "📊 Autobot log analysis complete.\n\n"
     caption += "\n".join(warnings) if warnings else "✅ No warnings. All looks good."
 
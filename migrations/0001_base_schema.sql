@@ -0,0 +1,70 @@
+-- Users, withdrawals and audit logs. Written defensively so it also upgrades
+-- databases created by the older ad-hoc migrate_schema() scripts.
+DO $$
+BEGIN
+  IF NOT EXISTS (SELECT 1 FROM information_schema.tables WHERE table_name='users') THEN
+    CREATE TABLE users (
+      id BIGSERIAL PRIMARY KEY,
+      tg_user_id BIGINT UNIQUE,
+      username TEXT,
+      full_name TEXT,
+      role TEXT NOT NULL DEFAULT 'user' CHECK (role IN ('admin','manager','support','user')),
+      balance NUMERIC(18,6) NOT NULL DEFAULT 0,
+      created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+    );
+  END IF;
+
+  IF NOT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name='users' AND column_name='tg_user_id') THEN
+    ALTER TABLE users ADD COLUMN tg_user_id BIGINT;
+  END IF;
+  IF NOT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name='users' AND column_name='username') THEN
+    ALTER TABLE users ADD COLUMN username TEXT;
+  END IF;
+  IF NOT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name='users' AND column_name='full_name') THEN
+    ALTER TABLE users ADD COLUMN full_name TEXT;
+  END IF;
+  IF NOT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name='users' AND column_name='role') THEN
+    ALTER TABLE users ADD COLUMN role TEXT NOT NULL DEFAULT 'user';
+  END IF;
+  IF NOT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name='users' AND column_name='balance') THEN
+    ALTER TABLE users ADD COLUMN balance NUMERIC(18,6) NOT NULL DEFAULT 0;
+  END IF;
+  IF NOT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name='users' AND column_name='created_at') THEN
+    ALTER TABLE users ADD COLUMN created_at TIMESTAMPTZ NOT NULL DEFAULT NOW();
+  END IF;
+
+  IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname='users_tg_user_id_key') THEN
+    ALTER TABLE users ADD CONSTRAINT users_tg_user_id_key UNIQUE (tg_user_id);
+  END IF;
+END $$;
+
+-- Backfill legacy tg_id if the column exists
+DO $$ BEGIN
+IF EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name='users' AND column_name='tg_id') THEN
+  UPDATE users SET tg_id = COALESCE(tg_id, tg_user_id) WHERE tg_id IS NULL;
+END IF; END $$;
+
+CREATE TABLE IF NOT EXISTS withdrawals (
+  id BIGSERIAL PRIMARY KEY,
+  user_id BIGINT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+  amount NUMERIC(18,6) NOT NULL CHECK (amount > 0),
+  address TEXT NOT NULL,
+  network TEXT NOT NULL DEFAULT 'TRC20',
+  status TEXT NOT NULL DEFAULT 'pending' CHECK (status IN ('pending','approved','denied')),
+  requested_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+  decided_at TIMESTAMPTZ,
+  decided_by TEXT,
+  txid TEXT,
+  note TEXT
+);
+CREATE INDEX IF NOT EXISTS withdrawals_status_idx ON withdrawals(status);
+
+CREATE TABLE IF NOT EXISTS audit_logs (
+  id BIGSERIAL PRIMARY KEY,
+  actor TEXT,
+  action TEXT NOT NULL,
+  entity_type TEXT,
+  entity_id TEXT,
+  meta JSONB,
+  created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
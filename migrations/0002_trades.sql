@@ -0,0 +1,11 @@
+-- Trades table, previously only created by admin_panel/schema.sql.
+CREATE TABLE IF NOT EXISTS trades (
+  id BIGSERIAL PRIMARY KEY,
+  user_id BIGINT REFERENCES users(id) ON DELETE SET NULL,
+  ts TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+  symbol TEXT,
+  side TEXT CHECK (side IN ('buy','sell')),
+  qty NUMERIC(18,6),
+  price NUMERIC(18,6),
+  pnl NUMERIC(18,6)
+);
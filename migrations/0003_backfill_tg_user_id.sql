@@ -0,0 +1,8 @@
+-- Legacy rows identified only by tg_id: copy it into tg_user_id so lookups and
+-- ON CONFLICT (tg_user_id) upserts find them.
+DO $$ BEGIN
+IF EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name='users' AND column_name='tg_id') THEN
+  UPDATE users SET tg_user_id = tg_id
+  WHERE tg_user_id IS NULL AND tg_id IS NOT NULL
+    AND NOT EXISTS (SELECT 1 FROM users u2 WHERE u2.tg_user_id = users.tg_id);
+END IF; END $$;
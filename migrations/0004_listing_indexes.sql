@@ -0,0 +1,12 @@
+-- migrate: no-transaction
+-- Keyset pagination for admin listings: ORDER BY <ts> DESC, id DESC with
+-- WHERE (<ts>, id) < (cursor) walks these indexes instead of sorting the table.
+-- Built CONCURRENTLY so writes to users / audit_logs / withdrawals carry on
+-- during the build; each statement runs on its own, outside a transaction.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS users_created_at_id_idx ON users (created_at DESC, id DESC);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS audit_logs_created_at_id_idx ON audit_logs (created_at DESC, id DESC);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS withdrawals_requested_at_id_idx ON withdrawals (requested_at DESC, id DESC);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS withdrawals_status_requested_at_id_idx ON withdrawals (status, requested_at DESC, id DESC);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS withdrawals_user_requested_at_id_idx ON withdrawals (user_id, requested_at DESC, id DESC);
+-- Covered by the (status, requested_at, id) index above.
+DROP INDEX CONCURRENTLY IF EXISTS withdrawals_status_idx;
@@ -0,0 +1,28 @@
+-- Change tracking for delta exports: updated_at is stamped on insert and on
+-- every update that actually changes the row (no-op upserts leave it alone).
+ALTER TABLE users ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ;
+UPDATE users SET updated_at = created_at WHERE updated_at IS NULL;
+ALTER TABLE users ALTER COLUMN updated_at SET DEFAULT NOW(), ALTER COLUMN updated_at SET NOT NULL;
+
+ALTER TABLE withdrawals ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ;
+UPDATE withdrawals SET updated_at = COALESCE(decided_at, requested_at) WHERE updated_at IS NULL;
+ALTER TABLE withdrawals ALTER COLUMN updated_at SET DEFAULT NOW(), ALTER COLUMN updated_at SET NOT NULL;
+
+CREATE OR REPLACE FUNCTION touch_updated_at() RETURNS trigger AS $$
+BEGIN
+  IF TG_OP = 'INSERT' OR NEW IS DISTINCT FROM OLD THEN
+    NEW.updated_at := clock_timestamp();
+  END IF;
+  RETURN NEW;
+END $$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS users_touch_updated_at ON users;
+CREATE TRIGGER users_touch_updated_at BEFORE INSERT OR UPDATE ON users
+  FOR EACH ROW EXECUTE PROCEDURE touch_updated_at();
+
+DROP TRIGGER IF EXISTS withdrawals_touch_updated_at ON withdrawals;
+CREATE TRIGGER withdrawals_touch_updated_at BEFORE INSERT OR UPDATE ON withdrawals
+  FOR EACH ROW EXECUTE PROCEDURE touch_updated_at();
+
+CREATE INDEX IF NOT EXISTS users_updated_at_id_idx ON users (updated_at, id);
+CREATE INDEX IF NOT EXISTS withdrawals_updated_at_id_idx ON withdrawals (updated_at, id);
@@ -0,0 +1,82 @@
+-- Aggregates for /admin/summary, maintained by statement-level triggers so the
+-- endpoint reads a handful of rows instead of scanning users and withdrawals.
+-- Deltas are spread over 16 slots (by backend pid) so concurrent writers do not
+-- all queue on one row lock; readers sum the slots.
+CREATE TABLE IF NOT EXISTS admin_counters (
+  slot SMALLINT PRIMARY KEY,
+  users BIGINT NOT NULL DEFAULT 0,
+  total_balance NUMERIC(24,6) NOT NULL DEFAULT 0,
+  pending_withdrawals BIGINT NOT NULL DEFAULT 0
+);
+
+CREATE OR REPLACE FUNCTION bump_admin_counters(d_users BIGINT, d_balance NUMERIC, d_pending BIGINT) RETURNS void AS $$
+  INSERT INTO admin_counters (slot, users, total_balance, pending_withdrawals)
+  VALUES (pg_backend_pid() % 16, d_users, d_balance, d_pending)
+  ON CONFLICT (slot) DO UPDATE SET
+    users = admin_counters.users + EXCLUDED.users,
+    total_balance = admin_counters.total_balance + EXCLUDED.total_balance,
+    pending_withdrawals = admin_counters.pending_withdrawals + EXCLUDED.pending_withdrawals;
+$$ LANGUAGE sql;
+
+CREATE OR REPLACE FUNCTION users_counters() RETURNS trigger AS $$
+DECLARE
+  d_users BIGINT := 0;
+  d_balance NUMERIC := 0;
+BEGIN
+  IF TG_OP IN ('INSERT', 'UPDATE') THEN
+    SELECT d_users + COUNT(*), d_balance + COALESCE(SUM(balance), 0) INTO d_users, d_balance FROM new_rows;
+  END IF;
+  IF TG_OP IN ('UPDATE', 'DELETE') THEN
+    SELECT d_users - COUNT(*), d_balance - COALESCE(SUM(balance), 0) INTO d_users, d_balance FROM old_rows;
+  END IF;
+  IF d_users <> 0 OR d_balance <> 0 THEN
+    PERFORM bump_admin_counters(d_users, d_balance, 0);
+  END IF;
+  RETURN NULL;
+END $$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION withdrawals_counters() RETURNS trigger AS $$
+DECLARE
+  d_pending BIGINT := 0;
+BEGIN
+  IF TG_OP IN ('INSERT', 'UPDATE') THEN
+    SELECT d_pending + COUNT(*) INTO d_pending FROM new_rows WHERE status = 'pending';
+  END IF;
+  IF TG_OP IN ('UPDATE', 'DELETE') THEN
+    SELECT d_pending - COUNT(*) INTO d_pending FROM old_rows WHERE status = 'pending';
+  END IF;
+  IF d_pending <> 0 THEN
+    PERFORM bump_admin_counters(0, 0, d_pending);
+  END IF;
+  RETURN NULL;
+END $$ LANGUAGE plpgsql;
+
+-- Block writers while the triggers are installed and the counters seeded.
+LOCK TABLE users, withdrawals IN SHARE ROW EXCLUSIVE MODE;
+
+DROP TRIGGER IF EXISTS users_counters_ins ON users;
+DROP TRIGGER IF EXISTS users_counters_upd ON users;
+DROP TRIGGER IF EXISTS users_counters_del ON users;
+CREATE TRIGGER users_counters_ins AFTER INSERT ON users
+  REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE PROCEDURE users_counters();
+CREATE TRIGGER users_counters_upd AFTER UPDATE ON users
+  REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE PROCEDURE users_counters();
+CREATE TRIGGER users_counters_del AFTER DELETE ON users
+  REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE PROCEDURE users_counters();
+
+DROP TRIGGER IF EXISTS withdrawals_counters_ins ON withdrawals;
+DROP TRIGGER IF EXISTS withdrawals_counters_upd ON withdrawals;
+DROP TRIGGER IF EXISTS withdrawals_counters_del ON withdrawals;
+CREATE TRIGGER withdrawals_counters_ins AFTER INSERT ON withdrawals
+  REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE PROCEDURE withdrawals_counters();
+CREATE TRIGGER withdrawals_counters_upd AFTER UPDATE ON withdrawals
+  REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE PROCEDURE withdrawals_counters();
+CREATE TRIGGER withdrawals_counters_del AFTER DELETE ON withdrawals
+  REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE PROCEDURE withdrawals_counters();
+
+DELETE FROM admin_counters;
+INSERT INTO admin_counters (slot, users, total_balance, pending_withdrawals)
+SELECT 0,
+       (SELECT COUNT(*) FROM users),
+       (SELECT COALESCE(SUM(balance), 0) FROM users),
+       (SELECT COUNT(*) FROM withdrawals WHERE status = 'pending');
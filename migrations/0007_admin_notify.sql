@@ -0,0 +1,47 @@
+-- Change notifications for the admin event stream (/admin/events). One NOTIFY
+-- per statement on channel admin_events, carrying the ids of rows that actually
+-- changed; statements touching more than 200 rows send "ids": null so
+-- listeners reload instead. Delivered only when the transaction commits.
+CREATE OR REPLACE FUNCTION notify_admin_events() RETURNS trigger AS $$
+DECLARE
+  changed BIGINT[];
+BEGIN
+  IF TG_OP = 'INSERT' THEN
+    SELECT array_agg(id) INTO changed FROM new_rows;
+  ELSIF TG_OP = 'UPDATE' THEN
+    SELECT array_agg(n.id) INTO changed
+    FROM new_rows n JOIN old_rows o ON o.id = n.id
+    WHERE n IS DISTINCT FROM o;
+  ELSE
+    SELECT array_agg(id) INTO changed FROM old_rows;
+  END IF;
+  IF changed IS NULL THEN
+    RETURN NULL;
+  END IF;
+  PERFORM pg_notify('admin_events', json_build_object(
+    'table', TG_TABLE_NAME,
+    'op', lower(TG_OP),
+    'ids', CASE WHEN cardinality(changed) <= 200 THEN to_json(changed) END
+  )::text);
+  RETURN NULL;
+END $$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS users_notify_ins ON users;
+DROP TRIGGER IF EXISTS users_notify_upd ON users;
+DROP TRIGGER IF EXISTS users_notify_del ON users;
+CREATE TRIGGER users_notify_ins AFTER INSERT ON users
+  REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE PROCEDURE notify_admin_events();
+CREATE TRIGGER users_notify_upd AFTER UPDATE ON users
+  REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE PROCEDURE notify_admin_events();
+CREATE TRIGGER users_notify_del AFTER DELETE ON users
+  REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE PROCEDURE notify_admin_events();
+
+DROP TRIGGER IF EXISTS withdrawals_notify_ins ON withdrawals;
+DROP TRIGGER IF EXISTS withdrawals_notify_upd ON withdrawals;
+DROP TRIGGER IF EXISTS withdrawals_notify_del ON withdrawals;
+CREATE TRIGGER withdrawals_notify_ins AFTER INSERT ON withdrawals
+  REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE PROCEDURE notify_admin_events();
+CREATE TRIGGER withdrawals_notify_upd AFTER UPDATE ON withdrawals
+  REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE PROCEDURE notify_admin_events();
+CREATE TRIGGER withdrawals_notify_del AFTER DELETE ON withdrawals
+  REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE PROCEDURE notify_admin_events();
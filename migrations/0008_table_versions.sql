@@ -0,0 +1,54 @@
+-- Per-table change counters for API ETags. Bumped in the writing transaction,
+-- so a reader sees a new version exactly when the change becomes visible
+-- (unlike max(updated_at), which a slow concurrent commit can leave behind).
+-- Spread over the same pid slots as the summary counters; readers sum them.
+ALTER TABLE admin_counters
+  ADD COLUMN IF NOT EXISTS users_version BIGINT NOT NULL DEFAULT 0,
+  ADD COLUMN IF NOT EXISTS withdrawals_version BIGINT NOT NULL DEFAULT 0,
+  ADD COLUMN IF NOT EXISTS logs_version BIGINT NOT NULL DEFAULT 0;
+
+CREATE OR REPLACE FUNCTION bump_table_version(tbl TEXT) RETURNS void AS $$
+  INSERT INTO admin_counters (slot, users_version, withdrawals_version, logs_version)
+  VALUES (pg_backend_pid() % 16, (tbl = 'users')::int, (tbl = 'withdrawals')::int, (tbl = 'audit_logs')::int)
+  ON CONFLICT (slot) DO UPDATE SET
+    users_version = admin_counters.users_version + EXCLUDED.users_version,
+    withdrawals_version = admin_counters.withdrawals_version + EXCLUDED.withdrawals_version,
+    logs_version = admin_counters.logs_version + EXCLUDED.logs_version;
+$$ LANGUAGE sql;
+
+-- users / withdrawals: bump alongside the admin_events notification, which
+-- already skips statements that changed nothing.
+CREATE OR REPLACE FUNCTION notify_admin_events() RETURNS trigger AS $$
+DECLARE
+  changed BIGINT[];
+BEGIN
+  IF TG_OP = 'INSERT' THEN
+    SELECT array_agg(id) INTO changed FROM new_rows;
+  ELSIF TG_OP = 'UPDATE' THEN
+    SELECT array_agg(n.id) INTO changed
+    FROM new_rows n JOIN old_rows o ON o.id = n.id
+    WHERE n IS DISTINCT FROM o;
+  ELSE
+    SELECT array_agg(id) INTO changed FROM old_rows;
+  END IF;
+  IF changed IS NULL THEN
+    RETURN NULL;
+  END IF;
+  PERFORM bump_table_version(TG_TABLE_NAME);
+  PERFORM pg_notify('admin_events', json_build_object(
+    'table', TG_TABLE_NAME,
+    'op', lower(TG_OP),
+    'ids', CASE WHEN cardinality(changed) <= 200 THEN to_json(changed) END
+  )::text);
+  RETURN NULL;
+END $$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION audit_logs_version() RETURNS trigger AS $$
+BEGIN
+  PERFORM bump_table_version(TG_TABLE_NAME);
+  RETURN NULL;
+END $$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS audit_logs_version ON audit_logs;
+CREATE TRIGGER audit_logs_version AFTER INSERT OR UPDATE OR DELETE ON audit_logs
+  FOR EACH STATEMENT EXECUTE PROCEDURE audit_logs_version();
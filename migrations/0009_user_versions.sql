@@ -0,0 +1,58 @@
+-- Per-user change counter for a user's own ETags (/me, /dashboard, /withdrawals).
+-- Bumped in the writing transaction whenever the user's row or one of their
+-- withdrawals changes, so a poll checks one primary-key row however long the
+-- user's history is. Users without a row here are at version 0.
+CREATE TABLE IF NOT EXISTS user_versions (
+  user_id BIGINT PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
+  version BIGINT NOT NULL DEFAULT 0
+);
+
+-- The users rows are locked before the counter rows (an UPDATE of users already
+-- holds them), so every writer takes the two in the same order: withdrawal
+-- writes that also touch the balance cannot deadlock against each other here.
+-- Users deleted in the same statement are skipped.
+CREATE OR REPLACE FUNCTION bump_user_versions(user_ids BIGINT[]) RETURNS void AS $$
+  WITH locked AS (
+    SELECT id FROM users WHERE id = ANY(user_ids) ORDER BY id FOR NO KEY UPDATE
+  )
+  INSERT INTO user_versions (user_id, version)
+  SELECT id, 1 FROM locked ORDER BY id
+  ON CONFLICT (user_id) DO UPDATE SET version = user_versions.version + 1;
+$$ LANGUAGE sql;
+
+CREATE OR REPLACE FUNCTION touch_user_versions() RETURNS trigger AS $$
+DECLARE
+  changed BIGINT[];
+BEGIN
+  IF TG_TABLE_NAME = 'users' THEN
+    SELECT array_agg(n.id) INTO changed
+    FROM new_rows n JOIN old_rows o ON o.id = n.id
+    WHERE n IS DISTINCT FROM o;
+  ELSIF TG_OP = 'INSERT' THEN
+    SELECT array_agg(DISTINCT user_id) INTO changed FROM new_rows;
+  ELSIF TG_OP = 'UPDATE' THEN
+    SELECT array_agg(DISTINCT n.user_id) INTO changed
+    FROM new_rows n JOIN old_rows o ON o.id = n.id
+    WHERE n IS DISTINCT FROM o;
+  ELSE
+    SELECT array_agg(DISTINCT user_id) INTO changed FROM old_rows;
+  END IF;
+  IF changed IS NOT NULL THEN
+    PERFORM bump_user_versions(changed);
+  END IF;
+  RETURN NULL;
+END $$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS users_user_versions_upd ON users;
+CREATE TRIGGER users_user_versions_upd AFTER UPDATE ON users
+  REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE PROCEDURE touch_user_versions();
+
+DROP TRIGGER IF EXISTS withdrawals_user_versions_ins ON withdrawals;
+DROP TRIGGER IF EXISTS withdrawals_user_versions_upd ON withdrawals;
+DROP TRIGGER IF EXISTS withdrawals_user_versions_del ON withdrawals;
+CREATE TRIGGER withdrawals_user_versions_ins AFTER INSERT ON withdrawals
+  REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE PROCEDURE touch_user_versions();
+CREATE TRIGGER withdrawals_user_versions_upd AFTER UPDATE ON withdrawals
+  REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE PROCEDURE touch_user_versions();
+CREATE TRIGGER withdrawals_user_versions_del AFTER DELETE ON withdrawals
+  REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE PROCEDURE touch_user_versions();
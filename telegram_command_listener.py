@@ -7,6 +7,7 @@ import os
 import pandas as pd
 import matplotlib.pyplot as plt
 from utils.telegram_alert import send_telegram_message, send_telegram_file
+from bot.graph import stale_chart, chart_rendered
 
 CONFIG_FILE = "telegram_config.json"
 AUTOBOT_LOG = "logs/autobot_log.csv"
@@ -44,16 +45,22 @@ def listen_for_commands():
 
                 if text.startswith("/analyze"):
                     if os.path.exists(AUTOBOT_LOG):
-                        df = pd.read_csv(AUTOBOT_LOG)
-                        if len(df) > 0:
-                            plt.figure(figsize=(10, 4))
-                            plt.plot(df["Trade"], df["Balance"], marker='o')
-                            plt.title("Autobot Performance")
-                            plt.xlabel("Trade")
-                            plt.ylabel("Balance")
-                            plt.grid(True)
-                            plt.tight_layout()
-                            plt.savefig(CHART_FILE)
+                        # Re-render only when the log (size, mtime, row count) or the chart settings changed.
+                        key = stale_chart(CHART_FILE, AUTOBOT_LOG, x="Trade", y="Balance", figsize=(10, 4))
+                        fresh = key is None
+                        df = None if fresh else pd.read_csv(AUTOBOT_LOG)
+                        if fresh or len(df) > 0:
+                            if not fresh:
+                                plt.figure(figsize=(10, 4))
+                                plt.plot(df["Trade"], df["Balance"], marker='o')
+                                plt.title("Autobot Performance")
+                                plt.xlabel("Trade")
+                                plt.ylabel("Balance")
+                                plt.grid(True)
+                                plt.tight_layout()
+                                plt.savefig(CHART_FILE)
+                                plt.close()
+                                chart_rendered(CHART_FILE, key)
                             send_telegram_message("📈 Autobot Analysis Completed:")
                             send_telegram_file(CHART_FILE, file_type="photo")
                             send_telegram_file(AUTOBOT_LOG, file_type="document")
@@ -2,14 +2,20 @@ import pandas as pd
 import matplotlib.pyplot as plt
 import os
 
-def generate_summary():
-    if not os.path.exists("trade_log.csv"):
+from bot.summary import PnlAccumulator, SUMMARY_CHUNK_ROWS
+from bot.graph import stale_chart, chart_rendered
+
+def generate_summary(path="trade_log.csv", chunksize=SUMMARY_CHUNK_ROWS):
+    if not os.path.exists(path):
         return "No trades yet."
-    df = pd.read_csv("trade_log.csv")
-    total = df["pnl"].sum()
-    trades = len(df)
-    wins = (df["pnl"] > 0).sum()
-    losses = (df["pnl"] <= 0).sum()
+    # Streamed in blocks so a huge log never has to fit in memory; same figures as a full read_csv.
+    acc = PnlAccumulator()
+    for chunk in pd.read_csv(path, usecols=["pnl"], chunksize=chunksize):
+        acc.add(chunk["pnl"].to_numpy(dtype=float))
+    total = acc.total
+    trades = acc.n
+    wins = acc.wins
+    losses = acc.n - acc.wins - acc.missing  # pnl <= 0; rows without a pnl are neither
     return f"""📊 TrustMe AI Performance Summary:
 
 Total Trades: {trades}
@@ -22,6 +28,10 @@ Win Rate: {wins / trades * 100:.1f}%
 def generate_graph():
     if not os.path.exists("trade_log.csv"):
         return
+    # Redrawn only when the log (size, mtime, row count) or what is plotted changes.
+    key = stale_chart("equity_curve.png", "trade_log.csv", y="pnl", kind="equity")
+    if key is None:
+        return
     df = pd.read_csv("trade_log.csv")
     df["equity"] = df["pnl"].cumsum()
     plt.figure()
@@ -29,4 +39,5 @@ def generate_graph():
     plt.title("Equity Curve")
     plt.xlabel("Trades")
     plt.ylabel("PnL")
-    plt.savefig("equity_curve.png")
\ No newline at end of file
+    plt.savefig("equity_curve.png")
+    chart_rendered("equity_curve.png", key)
\ No newline at end of file